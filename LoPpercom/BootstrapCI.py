@@ -0,0 +1,92 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Bootstrap confidence intervals for the group mean upper bounds of a heatmap.
+
+People are the resampling units: every replicate draws a group of the same size
+with replacement, and the same draw is used for every cell so that the intervals
+of the DL, RL and DL-RL maps are consistent. All replicates are drawn as a single
+(replicates x people) index matrix and reduced with matrix products against the
+per-person results of the store (see ResultsStore.py).
+'''
+
+from __future__ import division
+import numpy as np
+import ResultsStore
+
+def bootstrap_heatmaps(results, listSpatialRes, listTemporalRes, persons = "All", replicates = 2000, alpha = 0.05, random_state = None):
+    """
+    Computes percentile bootstrap confidence intervals of the mean upper bound of every cell.
+
+    As for the point estimates, people whose solve failed under either method in a cell are left out
+    of that cell, so a replicate's mean is over the non-failed people it drew.
+
+    Returns a dictionary keyed RL, DL and DLmRL (the difference map plotted by Graphing.py) of
+    (low, high) pairs of 2D arrays (spatial x temporal).
+
+    :param results: Column arrays as returned by ResultsStore.load_results
+    :type results: dict
+    :param listSpatialRes: Spatial resolutions, one per heatmap row
+    :type listSpatialRes: list of ints denoting meters
+    :param listTemporalRes: Temporal resolutions, one per heatmap column
+    :type listTemporalRes: list of datetime.timedelta
+    :param persons: List of person IDs, or "All" for every person in the store
+    :type persons: list of ints or str
+    :param replicates: Number of bootstrap replicates
+    :type replicates: int
+    :param alpha: The intervals cover 1 - alpha
+    :type alpha: float
+    :param random_state: Seed or numpy RandomState
+    :type random_state: int or np.random.RandomState
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    mask, cell = ResultsStore.select_cells(results, listSpatialRes, listTemporalRes, persons)
+    shape = (len(listSpatialRes), len(listTemporalRes))
+    n_cells = shape[0] * shape[1]
+
+    _, person_idx = np.unique(results['person'][mask], return_inverse=True)
+    n_persons = person_idx.max() + 1
+
+    # person x cell matrices, failed entries contribute nothing
+    ok = np.zeros((n_persons, n_cells))
+    Pi_RL = np.zeros((n_persons, n_cells))
+    Pi_DL = np.zeros((n_persons, n_cells))
+    failed = results['failed'][mask]
+    ok[person_idx, cell] = ~failed
+    Pi_RL[person_idx, cell] = np.where(failed, 0, results['Pi_RL'][mask])
+    Pi_DL[person_idx, cell] = np.where(failed, 0, results['Pi_DL'][mask])
+
+    # How many times each person is drawn in each replicate
+    draws = random_state.randint(0, n_persons, size=(replicates, n_persons))
+    draws += n_persons * np.arange(replicates)[:, None]
+    multiplicity = np.bincount(draws.ravel(), minlength=replicates * n_persons).reshape(replicates, n_persons).astype(np.float64)
+
+    ok_ct = multiplicity.dot(ok)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = {'RL' : multiplicity.dot(Pi_RL) / ok_ct,
+                 'DL' : multiplicity.dot(Pi_DL) / ok_ct}
+    means['DLmRL'] = means['DL'] - means['RL']
+
+    rtn = {}
+    for key, replicate_means in means.items():
+        low, high = np.nanpercentile(replicate_means, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        rtn[key] = (low.reshape(shape), high.reshape(shape))
+    return rtn
@@ -0,0 +1,96 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Read-optimised access to the preprocessing caches.
+
+Caches are written once (see GeolifeSymbolisation._write_cache) and then only read,
+so they are opened read-only and immutable, which lets SQLite skip file locking and
+change detection, with the file memory mapped and a large page cache. Connections
+are pooled by filename so that a sweep over many resolutions or repeated loads of
+the same resolution reuse them.
+
+As SQLite does not look for changes to an immutable database, a pooled connection is
+reopened if its file has been replaced or modified since it was opened, and anything
+writing to a cache closes the pooled connection first (see close_cache).
+'''
+
+import apsw
+import os
+import urllib
+
+# Bytes of each cache to memory map, and page cache size in KiB
+MMAP_SIZE = 1024 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+_pool = {} # absolute path -> (connection, file signature, process ID)
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+def open_cache(path):
+    """
+    Returns a pooled read-only connection to a preprocessing cache, opening it if required.
+
+    :param path: Filename of the cache
+    :type path: str
+    """
+    if not os.path.exists(path):
+        raise Exception("Error: The cache {} does not exist.".format(path))
+
+    key = os.path.abspath(path)
+    signature = _signature(key)
+    pooled = _pool.get(key)
+    if pooled is not None:
+        connection, pooled_signature, pid = pooled
+        if pid != os.getpid():
+            # inherited over a fork, leave it to the parent
+            del _pool[key]
+        elif pooled_signature == signature:
+            return connection
+        else:
+            close_cache(key)
+
+    uri = 'file:{}?immutable=1'.format(urllib.quote(key))
+    connection = apsw.Connection(uri, flags = apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI)
+    curs = connection.cursor()
+    curs.execute("PRAGMA mmap_size = {}".format(MMAP_SIZE))
+    curs.execute("PRAGMA cache_size = -{}".format(CACHE_SIZE_KB))
+    curs.close()
+
+    _pool[key] = (connection, signature, os.getpid())
+    return connection
+
+def close_cache(path = None):
+    """
+    Closes the pooled connection to a cache, or every pooled connection if path is None.
+    Must be called before a cache is written to or replaced.
+
+    :param path: Filename of the cache
+    :type path: str
+    """
+    if path is None:
+        keys = list(_pool.keys())
+    else:
+        keys = [os.path.abspath(path)]
+
+    for key in keys:
+        pooled = _pool.pop(key, None)
+        if pooled is not None and pooled[2] == os.getpid():
+            pooled[0].close()
@@ -30,6 +30,8 @@ import numpy as np
 from mlabwrap import mlab # @UnresolvedImport This is the import for mlabwrap
 import libEntropyCalc as GPU_LZ_EC # @UnresolvedImport
 import math
+from RunLengthCodec import rle_decode, get_N_DL_runs, get_N_RL_runs
+from SampledLZ import sampledEntropyRate
 
 def get_N_DL(sym_list):
     """
@@ -69,6 +71,168 @@ def get_N_RL(sym_list):
     return N
      
     
+def lzEntropyRate(sym_list_orig):
+    """
+    Computes the Lempel-Ziv estimate of the entropy rate of a single trajectory using the GPU library.
+    
+    :param sym_list_orig: A list of location symbols
+    :type sym_list_orig: list
+    """
+    sym_list = np.array(sym_list_orig).astype(np.int64)
+    n = len(sym_list[sym_list >= 0])
+    output = lzMatchLengths(sym_list)
+    #Calc the entropy :
+    return math.pow(sum( [ output[i] / math.log(i+1,2) for i in range(1,n)] ) * (1.0/n),-1)
+
+def lzMatchLengths(sym_list_orig):
+    """
+    Returns the Lempel-Ziv match length of every position of a trajectory, computed by the GPU library.
+    
+    :param sym_list_orig: A list of location symbols
+    :type sym_list_orig: list
+    """
+    #prepare data
+    sym_list = np.array(sym_list_orig).astype(np.int64)
+    output = np.zeros(len(sym_list), dtype=np.int64)
+    # Use EC lib
+    GPU_LZ_EC.EC( sym_list, output  )
+    return output
+
+def convergenceCurve(sym_list, step = 1):
+    """
+    Computes the entropy rate, N_DL and N_RL of every step-th prefix of a trajectory (and of the whole
+    trajectory) from a single Lempel-Ziv pass.
+    
+    The entropy rate of the prefix of length k is k / sum_{i=1}^{k-1} L_i / log2(i+1). A match length L_i
+    computed on the whole trajectory may run past the end of the prefix, so it is truncated to k - i + 1,
+    its length if the prefix were evaluated on its own. The truncation is applied for every prefix at once
+    with difference arrays, so the whole curve costs O(n) beyond the LZ pass.
+    
+    Returns a dictionary of arrays keyed k (prefix lengths), S, N_DL and N_RL.
+    
+    :param sym_list: A list of location symbols
+    :type sym_list: list
+    :param step: Spacing between the prefix lengths evaluated
+    :type step: int
+    """
+    sym_list = np.asarray(sym_list).astype(np.int64)
+    n = len(sym_list)
+    if n < 2:
+        raise Exception("Error: At least two symbols are required for a convergence curve, {} given.".format(n))
+    
+    k = np.arange(max(step, 2), n + 1, step)
+    if len(k) == 0 or k[-1] != n:
+        k = np.append(k, n)
+    
+    # S: cumulative sum of the match terms, less the part of the matches that overhang the prefix.
+    # Position i overhangs every prefix k in [i+1, i+L_i-2] by (L_i+i-1-k)/w_i, which is accumulated
+    # as A(k) - k*B(k) with A, B built from difference arrays.
+    L = lzMatchLengths(sym_list).astype(np.float64)
+    i = np.arange(1, n)
+    w = np.log2(i + 1)
+    cum = np.concatenate(([0.0, 0.0], np.cumsum(L[1:] / w))) # cum[k] = sum_{i=1}^{k-1} L_i/w_i
+    
+    first = i + 1
+    last = i + L[1:].astype(np.int64) - 2
+    overhang = (last >= first) & (first <= n)
+    dA = np.zeros(n + 2)
+    dB = np.zeros(n + 2)
+    np.add.at(dA, first[overhang], ((L[1:] + i - 1) / w)[overhang])
+    np.add.at(dA, np.minimum(last[overhang], n) + 1, -((L[1:] + i - 1) / w)[overhang])
+    np.add.at(dB, first[overhang], (1 / w)[overhang])
+    np.add.at(dB, np.minimum(last[overhang], n) + 1, -(1 / w)[overhang])
+    A = np.cumsum(dA)
+    B = np.cumsum(dB)
+    S = k / (cum[k] - (A[k] - k * B[k]))
+    
+    # N_DL: number of first visits up to k.
+    _, first_visit, inverse = np.unique(sym_list, return_index=True, return_inverse=True)
+    new_location = np.zeros(n, dtype=np.int64)
+    new_location[first_visit] = 1
+    N_DL = np.cumsum(new_location)[k - 1]
+    
+    # N_RL: the pair (s_i, s_i+1) is in the prefix when i <= k-2. Each first occurrence of a pair adds
+    # one successor to s_i, so N_RL(k) is the running maximum of the per-location successor counts.
+    n_loc = len(first_visit)
+    _, first_pair = np.unique(inverse[:-1] * n_loc + inverse[1:], return_index=True)
+    first_pair = np.sort(first_pair)
+    src = inverse[first_pair]
+    order = np.lexsort((first_pair, src))
+    group_start = np.concatenate(([True], src[order][1:] != src[order][:-1]))
+    rank = np.arange(len(order)) - np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+    successors = np.zeros(n - 1, dtype=np.int64)
+    successors[first_pair[order]] = rank + 1
+    N_RL = np.maximum.accumulate(successors)[k - 2]
+    
+    return {'k' : k, 'S' : S, 'N_DL' : N_DL, 'N_RL' : N_RL}
+
+def convergenceCurves(data, step = 1):
+    """
+    Applies convergenceCurve to every trajectory.
+    
+    :param data: List of trajectories
+    :type data: List of List of int
+    :param step: Spacing between the prefix lengths evaluated
+    :type step: int
+    """
+    print "Computing convergence curves..."
+    return [convergenceCurve(person, step) for person in data]
+
+def convergenceSummary(curves, tail_fraction = 0.1):
+    """
+    Summarises the convergence of each person's entropy rate estimate.
+    
+    Returns a dictionary of arrays, one entry per curve:
+    
+    * length: length of the trajectory
+    * S: entropy rate of the whole trajectory
+    * feasible_DL / feasible_RL: False if the whole trajectory is a known failure of the solve (S > log2(N))
+    * feasible_from_DL / feasible_from_RL: shortest evaluated prefix length from which every longer prefix
+      is feasible, -1 if the whole trajectory is not
+    * tail_variation: range of S over the last tail_fraction of the prefixes, relative to the final S
+    
+    :param curves: Convergence curves as returned by convergenceCurve
+    :type curves: list of dict
+    :param tail_fraction: Fraction of the prefix lengths considered the tail of the curve
+    :type tail_fraction: float
+    """
+    summary = dict( (key, []) for key in ['length','S','feasible_DL','feasible_RL','feasible_from_DL','feasible_from_RL','tail_variation'] )
+    for curve in curves:
+        summary['length'].append(curve['k'][-1])
+        summary['S'].append(curve['S'][-1])
+        for mode in ['DL','RL']:
+            feasible = curve['S'] <= np.log2(curve['N_' + mode])
+            summary['feasible_' + mode].append(feasible[-1])
+            # last infeasible prefix, every longer one is feasible
+            infeasible = np.flatnonzero(~feasible)
+            if len(infeasible) == 0:
+                summary['feasible_from_' + mode].append(curve['k'][0])
+            elif infeasible[-1] == len(feasible) - 1:
+                summary['feasible_from_' + mode].append(-1)
+            else:
+                summary['feasible_from_' + mode].append(curve['k'][infeasible[-1] + 1])
+        tail = curve['S'][int(len(curve['S']) * (1 - tail_fraction)):]
+        summary['tail_variation'].append((tail.max() - tail.min()) / curve['S'][-1] if len(tail) > 0 else 0.0)
+    
+    return dict( (key, np.asarray(value)) for key, value in summary.items() )
+
+def minimumLengthFilter(summary, min_length, max_tail_variation = None):
+    """
+    Returns a boolean mask of the people with at least min_length symbols whose estimate is feasible under
+    both methods and, if given, whose tail variation is at most max_tail_variation.
+    
+    :param summary: As returned by convergenceSummary
+    :type summary: dict
+    :param min_length: Minimum trajectory length
+    :type min_length: int
+    :param max_tail_variation: Maximum relative range of S over the tail of the curve
+    :type max_tail_variation: float
+    """
+    mask = (summary['length'] >= min_length) & summary['feasible_DL'] & summary['feasible_RL']
+    if max_tail_variation is not None:
+        mask &= summary['tail_variation'] <= max_tail_variation
+    return mask
+    
 def empiricalEntropyRate(data,N_mode = "DL"):
     
 
@@ -82,20 +246,10 @@ def empiricalEntropyRate(data,N_mode = "DL"):
     
     for person in data :
         
-        sym_list_orig = np.array(person)
+        sym_list = np.array(person).astype(np.int64)
         
-        #Entropy resolution:
-        #prepare data
-        sym_list = sym_list_orig.astype(np.int64)
-        output = np.zeros(len(sym_list_orig), dtype=np.int64)
-        output = output.astype(np.int64)
-        n = len(sym_list[sym_list >= 0])
-        # Use EC lib
-        GPU_LZ_EC.EC( sym_list, output  )
-        #Calc the entropy :
-        gpu_ent = math.pow(sum( [ output[i] / math.log(i+1,2) for i in range(1,n)] ) * (1.0/n),-1)
         #Append the entropy
-        empiricalEntropyRate.append(gpu_ent)
+        empiricalEntropyRate.append(lzEntropyRate(sym_list))
         
         #N resolution:
         if(N_mode == "DL"):
@@ -112,7 +266,113 @@ def empiricalEntropyRate(data,N_mode = "DL"):
     
     return empiricalEntropyRate, N
 
+def streamEntropyRates(person_stream, sample_budget = None, random_state = None):
+    """
+    Computes the entropy rate, N_DL and N_RL person by person, releasing each trajectory before the next
+    is loaded. Yields (person ID, S, N_DL, N_RL), with the same values as empiricalEntropyRate.
+    
+    :param person_stream: Iterable of (person ID, list of location symbols), e.g. GeolifeSymbolisation.stream_geolife_data
+    :type person_stream: iterable of tuples
+    :param sample_budget: None for the exact entropy rate, otherwise the number of positions used by the sampled
+        estimator (see SampledLZ.py)
+    :type sample_budget: int
+    :param random_state: Seed or numpy RandomState for the sampled estimator
+    :type random_state: int or np.random.RandomState
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    
+    for person, sym_list in person_stream:
+        if len(sym_list) == 0:
+            raise Exception("One or more person's trajectory was not loaded/created correctly.")
+        sym_list = np.asarray(sym_list).astype(np.int64)
+        if sample_budget is None:
+            S = lzEntropyRate(sym_list)
+        else:
+            S = sampledEntropyRate(sym_list, sample_budget, random_state = random_state)[0]
+        yield person, S, get_N_DL(sym_list), get_N_RL(sym_list)
 
+def entropyTriple(sym_list):
+    """
+    Computes the three entropies of Song et al. for a single trajectory, along with N_DL and N_RL:
+    
+    * S_actual: the Lempel-Ziv estimate of the entropy rate (as empiricalEntropyRate)
+    * S_rand: log2(N_DL), the entropy if every visited location were equally likely
+    * S_unc: the Shannon entropy of the visit histogram, ignoring the order of the visits
+    
+    The histogram, N_DL and N_RL all come from a single np.unique over the trajectory.
+    Returns (S_actual, S_rand, S_unc, N_DL, N_RL).
+    
+    :param sym_list: A list of location symbols
+    :type sym_list: list
+    """
+    sym_list = np.asarray(sym_list).astype(np.int64)
+    
+    S_actual = lzEntropyRate(sym_list)
+    
+    _, inverse, counts = np.unique(sym_list, return_inverse=True, return_counts=True)
+    N_DL = len(counts)
+    p = counts / len(sym_list)
+    S_rand = float(np.log2(N_DL))
+    # S_unc <= S_rand, with equality for a uniform histogram where rounding can otherwise put it just above log2(N)
+    S_unc = min(float(0.0 - np.sum(p * np.log2(p))), S_rand)
+    
+    # Distinct (location, next location) pairs, counted per location. Equal to get_N_RL.
+    pairs = np.unique(inverse[:-1] * N_DL + inverse[1:])
+    N_RL = int(np.bincount(pairs // N_DL).max()) if len(pairs) > 0 else 0
+    
+    return S_actual, S_rand, S_unc, N_DL, N_RL
+
+def empiricalEntropies(data):
+    """
+    Applies entropyTriple to every trajectory.
+    
+    Returns a dictionary of lists, one entry per person, keyed S_actual, S_rand, S_unc, N_DL and N_RL.
+    
+    :param data: List of trajectories
+    :type data: List of List of int
+    """
+    print "Computing empirical entropies..."
+    
+    keys = ['S_actual','S_rand','S_unc','N_DL','N_RL']
+    rtn = dict( (key, []) for key in keys )
+    for person in data:
+        for key, value in zip(keys, entropyTriple(person)):
+            rtn[key].append(value)
+    
+    return rtn
+
+def empiricalEntropyRateRuns(runs, N_mode = "DL"):
+    """
+    As empiricalEntropyRate but for run-length encoded trajectories (see RunLengthCodec.py).
+    
+    Each trajectory is only expanded for the Lempel-Ziv estimate, one person at a time.
+    N is computed directly on the runs.
+    
+    :param runs: List of (values, lengths) pairs, one per person
+    :type runs: list of tuples of int arrays
+    :param N_mode: DL (distinct locations) or RL (reachable locations)
+    :type N_mode: str
+    """
+    print "Computing empirical entropy rate..."
+    
+    if(N_mode == "DL"):
+        get_N = get_N_DL_runs
+    elif(N_mode == "RL"):
+        get_N = get_N_RL_runs
+    else:
+        raise Exception( "Error: Unknown N_mode. Only DL or RL known, {} given.".format(N_mode) )
+    
+    empiricalEntropyRate = [] 
+    N = []
+    for values, lengths in runs:
+        empiricalEntropyRate.append(lzEntropyRate(rle_decode(values, lengths)))
+        N.append(get_N(values, lengths))
+    
+    print "S :", empiricalEntropyRate
+    print "N : ", N
+    
+    return empiricalEntropyRate, N
 
 
 def process_symbolic_data( data, standard_method = True, refined_method = False):
@@ -160,3 +420,56 @@ def process_symbolic_data( data, standard_method = True, refined_method = False)
     
     return tmpG_DL
 
+def process_symbolic_data_triple( data ):
+    """
+    Given a list of trajectories (regularly sampled location integer symbols) returns the actual, random and
+    uncorrelated entropies of each (see entropyTriple) and the upper bound on the upper limit of predictability
+    for each of them.
+    
+    The Fano problems for the actual entropy (with both N_DL and N_RL) and for the uncorrelated entropy are solved
+    in a single batched Matlab call. Pi_rand is 1/N_DL, the exact solution of the Fano equation at S = log2(N),
+    which is not passed to the solver as rounding can push S just above log2(N) and make it fail the solve.
+    With a single location (N = 1) the solver cannot be used either (it needs log2(N-1)), there the next
+    location is certain so Pi is 1 when S = 0, and S > 0 is the known failure S > log2(N).
+    
+    Returns a dictionary of arrays keyed S_actual, S_rand, S_unc, N_DL, N_RL, Pi_actual_DL, Pi_actual_RL, Pi_rand and Pi_unc.
+    As in GeolifeEntropyCalc.run, a Pi of -99 marks a known failure of the solve (S > log2(N)), these are
+    left out of the printed summary.
+    
+    :param data: List of trajectories
+    :type data: List of List of int
+    """
+    rtn = empiricalEntropies(data)
+    n = len(data)
+    
+    S = np.asarray(rtn['S_actual'] + rtn['S_actual'] + rtn['S_unc'])
+    N = np.asarray(rtn['N_DL'] + rtn['N_RL'] + rtn['N_DL'])
+    
+    # Only N > 1 goes to the solver, see above for N = 1
+    Pi = np.where(S > 0, -99.0, 1.0)
+    solve = N > 1
+    if solve.any():
+        mlab.openPool()
+        Pi[solve] = list(mlab.ParLoP(S[solve].tolist(), N[solve].tolist())[0])
+        mlab.closePool()
+    
+    #-88 real fail in solve
+    #-99 known fail in solve when S > log2(N)
+    # See the Matlab script (ParLoP.m) for more details
+    if (Pi==-88).any():
+        raise Exception("ERROR: Matlab failed the solve, but the entropy was in the correct range. Therefore an unknown error has occured.")
+    
+    rtn = dict( (key, np.asarray(value)) for key, value in rtn.items() )
+    rtn['Pi_actual_DL'] = Pi[:n]
+    rtn['Pi_actual_RL'] = Pi[n:2*n]
+    rtn['Pi_unc'] = Pi[2*n:]
+    rtn['Pi_rand'] = 1.0 / rtn['N_DL']
+    
+    for key in ['Pi_actual_DL','Pi_actual_RL','Pi_unc']:
+        ok = rtn[key][rtn[key] != -99]
+        if len(ok) == 0:
+            print '\n{}: every solve failed (S > log2(N))'.format(key)
+        else:
+            print '\n{}: AVG: {} MIN: {} MAX: {} ({} failed)'.format(key, np.mean(ok), np.min(ok), np.max(ok), n - len(ok))
+    
+    return rtn
@@ -25,14 +25,19 @@ Created on 10 Jul 2013
 
 from __future__ import division
 from datetime import timedelta
-from GeolifeSymbolisation import get_geolife_data
+from GeolifeSymbolisation import get_geolife_data, stream_geolife_data
 from mlabwrap import mlab # @UnresolvedImport This is the import for mlabwrap
 import numpy as np
 import pylab as pl
 import time
 from Utils import ensure_dir
-from GenericLoP import empiricalEntropyRate
+from GenericLoP import empiricalEntropyRate, streamEntropyRates, lzEntropyRate, empiricalEntropyRateRuns
+from RunLengthEncoding import loadRunData, get_N_RL_runs
+from SampledLZ import sampledEntropyRate
+from SharedData import parallelEntropyRates
 import GeolifeSymbolisation
+import ResultsStore
+from BootstrapCI import bootstrap_heatmaps
 
 def parse_timedelta(time_str):
     """
@@ -79,18 +84,117 @@ def save_results( file_name, LoP, DL_RL):
 
 
 
-def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/final_graphs', bulk_build_preprocessing = False):
+def save_bootstrap( file_name, results, persons, replicates, alpha = 0.05 ):
+    """
+    Writes bootstrap confidence intervals (see BootstrapCI.py) of the RL, DL and DL-RL heatmaps next to
+    the heatmap CSVs, as <file_name><map>_ci_low.csv and <file_name><map>_ci_high.csv.
+    
+    :param file_name: Base filename of the heatmap CSVs
+    :type file_name: str
+    :param results: Column arrays as returned by ResultsStore.load_results
+    :type results: dict
+    :param persons: List of person IDs, or "All"
+    :type persons: list of ints or str
+    :param replicates: Number of bootstrap replicates
+    :type replicates: int
+    :param alpha: The intervals cover 1 - alpha
+    :type alpha: float
+    """
+    intervals = bootstrap_heatmaps(results, listSpatialRes, listTemporalRes, persons, replicates, alpha)
+    for DL_RL, (low, high) in intervals.items():
+        save_results( file_name, low, DL_RL + '_ci_low')
+        save_results( file_name, high, DL_RL + '_ci_high')
+
+def group_file_name( group, output_dir, scheme = 'healpix' ):
+    """
+    Returns the base filename of the heatmap CSVs for a group, creating the output directory if required.
+    
+    :param group: "All" or ["id_str",[list of ids in the geolife dataset]]
+    :type group: str or Nested list
+    :param output_dir: Directory the results are written to
+    :type output_dir: str
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py), appended to the name unless HEALPix
+    :type scheme: str
+    """
+    if(group == "All"):
+        suffix = "All"
+    else:
+        suffix = "Grp{}".format(group[0])
+    if scheme != 'healpix':
+        suffix = "{}_{}".format(suffix, scheme)
+    
+    if not output_dir[-1] == '/':
+        output_dir = output_dir + '/'
+        
+    file_name = "{}Heatmap_{}".format(output_dir,suffix)
+    
+    ensure_dir(file_name)
+    
+    return file_name
+
+def default_results_store( output_dir, scheme = 'healpix' ):
+    """
+    Returns the filename of the per-person results store used when none is given, one per quantisation scheme.
+    """
+    if scheme == 'healpix':
+        return output_dir.rstrip('/') + '/PersonResults.sqlite'
+    return output_dir.rstrip('/') + '/PersonResults_{}.sqlite'.format(scheme)
+
+def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/final_graphs', bulk_build_preprocessing = False, results_store = None, derive_temporal = False, streaming = False, sample_budget = None, bootstrap_replicates = None, alpha = 0.05, processes = None, run_length = False, scheme = 'healpix'):
     """
     Generates a single heatmap for a given list of Geolife ids, for a given method of computing the upper bound on
     the upper limit of predictability.
     
+    The per-person results of every cell are also written to a long-format results store
+    (see ResultsStore.py) so that heatmaps for other groups of the same people can later be
+    produced by run_from_store without recomputation.
+    
     :param group: ["id_str",[list of ids in the geolife dataset]]
     :type group: Nested list
     :param scale: [min_z, max_z, step]  Set the scale of the heatmap z
     :type scale: Float array
+    :param results_store: Filename of the per-person results store. Defaults to PersonResults.sqlite in output_dir
+        (PersonResults_<scheme>.sqlite for schemes other than HEALPix).
+    :type results_store: str
+    :param derive_temporal: When bulk building, derive the coarser temporal resolutions from the finest cache
+        instead of the raw data (see GeolifeSymbolisation.deriveTemporalCache). Requires bulk_build_preprocessing.
+    :type derive_temporal: Boolean
+    :param streaming: Load and evaluate one person at a time so that memory is bounded by the largest single
+        trajectory rather than the whole group. Results are identical.
+    :type streaming: Boolean
+    :param sample_budget: If given, use the sampled entropy rate estimator (see SampledLZ.py) with this many positions
+        per person, for fast exploratory sweeps. Approximate results are not written to the results store, so
+        results_store cannot be given.
+    :type sample_budget: int
+    :param bootstrap_replicates: If given, also write bootstrap confidence intervals with this many replicates (see save_bootstrap).
+        Requires the results store, so is not available with sample_budget.
+    :type bootstrap_replicates: int
+    :param alpha: The confidence intervals cover 1 - alpha
+    :type alpha: float
+    :param processes: If given, evaluate people in parallel over this many processes through the shared memory
+        data plane (see SharedData.py). Cannot be combined with streaming, run_length or sample_budget.
+    :type processes: int
+    :param run_length: Load each person as runs of repeated symbols (see RunLengthEncoding.py), only expanded for the
+        Lempel-Ziv estimate, instead of one row per symbol. Results are identical. Cannot be combined with processes, streaming or sample_budget.
+    :type run_length: Boolean
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py). Each scheme has its own caches, heatmap
+        files and default results store.
+    :type scheme: str
     """
     t = time.time()
     
+    # Only one way of loading and evaluating the data can be used
+    modes = [name for name, on in [('processes', processes is not None), ('streaming', streaming),
+                                   ('sample_budget', sample_budget is not None), ('run_length', run_length)] if on]
+    if len(modes) > 1 and modes != ['streaming', 'sample_budget']:
+        raise Exception("Error: {} cannot be combined.".format(" and ".join(modes)))
+    if sample_budget is not None and bootstrap_replicates is not None:
+        raise Exception("Error: bootstrap_replicates requires the results store, which is not written with sample_budget.")
+    if sample_budget is not None and results_store is not None:
+        raise Exception("Error: The results store is not written with sample_budget.")
+    if derive_temporal and not bulk_build_preprocessing:
+        raise Exception("Error: derive_temporal only applies when bulk_build_preprocessing is set.")
+    
     #Group setting
     if(group == "All"):
         suffix = "All"
@@ -99,13 +203,11 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
         suffix = "Grp{}".format(group[0])
         persons = group[1]
     
+    file_name = group_file_name(group, output_dir, scheme)
     
-    if not output_dir[-1] == '/':
-        output_dir = output_dir + '/'
-        
-    file_name = "{}Heatmap_{}".format(output_dir,suffix)
-    
-    ensure_dir(file_name)
+    if results_store is None:
+        results_store = default_results_store(output_dir, scheme)
+    store = ResultsStore.open_store(results_store, scheme) if sample_budget is None else None
     
     print "Calculing the LoP for {}".format(suffix)
     
@@ -114,7 +216,7 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
         # will skip caches if already built.
         # if this option is not specified and a cache does not exist
         # it will be built when required, using a single CPU core.
-        GeolifeSymbolisation.bulk_build_resolution_cache(listSpatialRes, listTemporalRes)
+        GeolifeSymbolisation.bulk_build_resolution_cache(listSpatialRes, listTemporalRes, scheme = scheme, derive_temporal = derive_temporal)
     
     mlab.openPool()
     failed_ids = set()
@@ -131,20 +233,45 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
             
             #Compute data
 
-            #---------------------------------------------
-            #Load data from an existing preproc database, this will have been created
-            # earlier if it did not exist.    
-            data, person_ids = get_geolife_data(spatialRes, temporalRes,persons)
-            #---------------------------------------------
-            
-            # Sanity check on loading
-            for person in data:
-                if len(person) == 0:
-                    raise Exception("One or more person's trajectory was not loaded/created correctly.")
-            # End sanity check
-            
-            S_RL, N_RL = empiricalEntropyRate(data,'RL')
-            S_DL, N_DL = empiricalEntropyRate(data,'DL')
+            if processes is not None:
+                # Trajectories are published once to shared memory, workers only receive index ranges.
+                person_ids, S_DL, N_DL, N_RL = parallelEntropyRates(stream_geolife_data(spatialRes, temporalRes, persons, scheme), processes = processes)
+                S_RL = S_DL
+            elif streaming or sample_budget is not None:
+                # Only the per-person scalars are kept, each trajectory is released once evaluated.
+                person_ids, S_DL, N_DL, N_RL = [], [], [], []
+                for person, S, N_DL_p, N_RL_p in streamEntropyRates(stream_geolife_data(spatialRes, temporalRes, persons, scheme), sample_budget):
+                    person_ids.append(person)
+                    S_DL.append(S)
+                    N_DL.append(N_DL_p)
+                    N_RL.append(N_RL_p)
+                S_RL = S_DL
+            elif run_length:
+                # N_DL and N_RL are computed on the runs, the LZ estimate is computed once and used for both
+                runs, person_ids = loadRunData(spatialRes, temporalRes, persons, scheme)
+                for values, lengths in runs:
+                    if len(values) == 0:
+                        raise Exception("One or more person's trajectory was not loaded/created correctly.")
+                S_DL, N_DL = empiricalEntropyRateRuns(runs, 'DL')
+                N_RL = [get_N_RL_runs(values, lengths) for values, lengths in runs]
+                S_RL = S_DL
+                del runs
+            else:
+                #---------------------------------------------
+                #Load data from an existing preproc database, this will have been created
+                # earlier if it did not exist.    
+                data, person_ids = get_geolife_data(spatialRes, temporalRes, persons, scheme)
+                #---------------------------------------------
+                
+                # Sanity check on loading
+                for person in data:
+                    if len(person) == 0:
+                        raise Exception("One or more person's trajectory was not loaded/created correctly.")
+                # End sanity check
+                
+                S_RL, N_RL = empiricalEntropyRate(data,'RL')
+                S_DL, N_DL = empiricalEntropyRate(data,'DL')
+                del data
                     
             #Save the average:
 
@@ -161,6 +288,9 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
             if (np.asarray(tmpG_DL)==-88).any():
                 raise Exception("ERROR: (DL) Matlab failed the solve, but the entropy was in the correct range. Therefore an unknown error has occured.")
             
+            if store is not None:
+                ResultsStore.record_cell(store, spatialRes, temporalRes, person_ids, S_DL, N_DL, N_RL, tmpG_DL, tmpG_RL)
+            
             
             # Replace known solve fails. These are the cases when an entropy is found that is to high. 
             # This means the LZ entropy rate estimate is wrong (the estimator has failed to converge)
@@ -204,12 +334,16 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
 
             
     mlab.closePool()
-    
+    if store is not None:
+        store.close()
 
     
     save_results( file_name, LoP_RL, 'RL')
     save_results( file_name, LoP_DL, 'DL')
     
+    if bootstrap_replicates is not None:
+        save_bootstrap( file_name, ResultsStore.load_results(results_store, scheme), persons, bootstrap_replicates, alpha )
+    
     f2 = file(file_name + "_failed_ct.csv", 'w')
     print 'failed_ids = {}.'.format( failed_ids )
     
@@ -218,7 +352,101 @@ def run( group = "All",scale = None, output_dir = './ResultsLoP_replication/fina
     
     print "Done in {} seconds".format(time.time() - t)
     
+def run_from_store( group = "All", output_dir = './ResultsLoP_replication/final_graphs', results_store = None, bootstrap_replicates = None, alpha = 0.05, scheme = 'healpix'):
+    """
+    Generates the heatmap CSVs for a group of Geolife ids from the per-person results store
+    written by run, without loading any data or calling Matlab.
+    
+    Every person in the group must already have been evaluated by run (in any group) for all
+    cells of the listSpatialRes x listTemporalRes grid.
+    
+    :param group: "All" or ["id_str",[list of ids in the geolife dataset]]
+    :type group: str or Nested list
+    :param output_dir: Directory the results are written to
+    :type output_dir: str
+    :param results_store: Filename of the per-person results store. Defaults to PersonResults.sqlite in output_dir
+        (PersonResults_<scheme>.sqlite for schemes other than HEALPix).
+    :type results_store: str
+    :param bootstrap_replicates: If given, also write bootstrap confidence intervals with this many replicates (see save_bootstrap)
+    :type bootstrap_replicates: int
+    :param alpha: The confidence intervals cover 1 - alpha
+    :type alpha: float
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py) the results were computed with
+    :type scheme: str
+    """
+    t = time.time()
+    
+    persons = "All" if group == "All" else group[1]
+    file_name = group_file_name(group, output_dir, scheme)
+    
+    if results_store is None:
+        results_store = default_results_store(output_dir, scheme)
+    
+    results = ResultsStore.load_results(results_store, scheme)
+    LoP_RL, LoP_DL, LoP_failed_ct, failed_ids = ResultsStore.group_heatmaps(results, listSpatialRes, listTemporalRes, persons)
+    
+    save_results( file_name, LoP_RL, 'RL')
+    save_results( file_name, LoP_DL, 'DL')
+    
+    if bootstrap_replicates is not None:
+        save_bootstrap( file_name, results, persons, bootstrap_replicates, alpha )
+    
+    f2 = file(file_name + "_failed_ct.csv", 'w')
+    print 'failed_ids = {}.'.format( failed_ids )
+    
+    np.savetxt(f2, LoP_failed_ct,fmt ="%.5f")
+    f2.close()
+    
+    print "Done in {} seconds".format(time.time() - t)
+    
+
+def calibrate_sampled_entropy( spatialRes, temporalRes, persons = "All", budgets = [100, 300, 1000, 3000], repeats = 5, z = 1.96, output_file = './ResultsLoP_replication/sampled_entropy_calibration.csv', scheme = 'healpix'):
+    """
+    Compares the sampled entropy rate estimator (see SampledLZ.py) with the exact GPU estimator on a cache,
+    reporting for each sample budget the mean relative error, the fraction of confidence intervals containing
+    the exact value and the mean speedup. Per-person results are written to a CSV file.
+    
+    :param spatialRes: The spatial resolution of the cache
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cache
+    :type temporalRes: datetime.timedelta
+    :param persons: List of person IDs or "All"
+    :type persons: list of ints or str
+    :param budgets: Sample budgets to evaluate
+    :type budgets: list of ints
+    :param repeats: Number of sampled estimates per person and budget
+    :type repeats: int
+    :param z: Standard normal quantile of the intervals, 1.96 for 95%
+    :type z: float
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py) of the cache
+    :type scheme: str
+    """
+    random_state = np.random.RandomState(0)
+    rows = []
+    for person, sym_list in stream_geolife_data(spatialRes, temporalRes, persons, scheme):
+        t = time.time()
+        S_exact = lzEntropyRate(sym_list)
+        t_exact = time.time() - t
+        for budget in budgets:
+            for _ in range(repeats):
+                t = time.time()
+                S, S_lo, S_hi = sampledEntropyRate(sym_list, budget, z, random_state)
+                t_sampled = time.time() - t
+                rows.append([person, len(sym_list), budget, S_exact, S, S_lo, S_hi, abs(S - S_exact) / S_exact,
+                             float(S_lo <= S_exact <= S_hi), t_exact / max(t_sampled, 1e-9)])
+    rows = np.asarray(rows, dtype=np.float64)
+    
+    print "Sampled entropy calibration S: {} T: {}".format(spatialRes, temporalRes)
+    print "budget  mean rel. error  CI coverage  mean speedup"
+    for budget in budgets:
+        b = rows[rows[:,2] == budget]
+        print "{:6d}  {:15.4f}  {:11.3f}  {:12.1f}".format(budget, b[:,7].mean(), b[:,8].mean(), b[:,9].mean())
+    
+    ensure_dir(output_file)
+    np.savetxt(output_file, rows, delimiter=',', fmt='%.6g',
+               header='person,length,budget,S_exact,S_sampled,S_low,S_high,rel_error,covered,speedup')
     
+    return rows
 
 if __name__ == '__main__':
     """
@@ -0,0 +1,195 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Spatio-temporal index over the raw GPS data, to restrict symbolisation and evaluation
+to the people and trajectories active within a region and time window.
+
+Each trajectory is cut into segments of a fixed duration (an hour by default). The
+bounding box and time range of every segment are kept in the geolife_segments table
+and in an SQLite R*Tree (geolife_rtree) over (latitude, longitude, time), both in the
+main database. The R*Tree stores 32 bit floats rounded outwards, so its matches are
+refined against the exact values of geolife_segments.
+'''
+
+from __future__ import division
+import apsw
+import calendar
+import os
+from GeolifeSymbolisation import main_geolifedb, preprocessing_dir, build_main_db, buildPreprocessingTable, iterData, fmt
+from Utils import ensure_dir
+from CacheAccess import open_cache, close_cache
+
+def buildIndex(segment_seconds = 3600):
+    """
+    Builds (or rebuilds) the segment table and R*Tree in the main database, along with an index on
+    geolife(person, traj, datetime) which also serves the per-trajectory queries of buildPreprocessingTable.
+
+    :param segment_seconds: Duration of the segments each trajectory is cut into
+    :type segment_seconds: int
+    """
+    if not os.path.exists( main_geolifedb ):
+        build_main_db()
+
+    connection = apsw.Connection(main_geolifedb)
+    curs = connection.cursor()
+
+    print "Indexing geolife (person, traj, datetime)..."
+    curs.execute("CREATE INDEX IF NOT EXISTS idx_person_traj_datetime_geolife ON geolife(person, traj, datetime)")
+
+    print "Building segments of {} seconds...".format(segment_seconds)
+    curs.execute("""DROP TABLE IF EXISTS geolife_segments;
+                    DROP TABLE IF EXISTS geolife_rtree;
+                    CREATE TABLE geolife_segments (id INTEGER PRIMARY KEY, person INT, traj INT, startTime TEXT, endTime TEXT, nPoints INT,
+                                                   minLat REAL, maxLat REAL, minLon REAL, maxLon REAL);
+                    CREATE VIRTUAL TABLE geolife_rtree USING rtree(id, minLat, maxLat, minLon, maxLon, minT, maxT);""")
+    curs.execute('BEGIN')
+    curs.execute("""INSERT INTO geolife_segments (person, traj, startTime, endTime, nPoints, minLat, maxLat, minLon, maxLon)
+                    SELECT person, traj, MIN(datetime), MAX(datetime), COUNT(*), MIN(latitude), MAX(latitude), MIN(longitude), MAX(longitude)
+                    FROM geolife WHERE NOT datetime = ''
+                    GROUP BY person, traj, CAST(strftime('%s', datetime) AS INTEGER) / {}""".format(int(segment_seconds)))
+    curs.execute("""INSERT INTO geolife_rtree
+                    SELECT id, minLat, maxLat, minLon, maxLon, CAST(strftime('%s', startTime) AS INTEGER), CAST(strftime('%s', endTime) AS INTEGER)
+                    FROM geolife_segments""")
+    curs.execute('END')
+
+    n = curs.execute("SELECT COUNT(*) FROM geolife_segments").fetchall()[0][0]
+    connection.close()
+    print "Done, {} segments indexed".format(n)
+
+def querySegments(minLat, maxLat, minLon, maxLon, start = None, end = None):
+    """
+    Returns the trajectory segments whose bounding box intersects the region and whose time range
+    intersects [start, end], as a list of (person, traj, startTime, endTime, nPoints).
+
+    :param minLat: Southern edge of the region
+    :type minLat: float
+    :param maxLat: Northern edge of the region
+    :type maxLat: float
+    :param minLon: Western edge of the region
+    :type minLon: float
+    :param maxLon: Eastern edge of the region
+    :type maxLon: float
+    :param start: Start of the time window, unbounded if None
+    :type start: datetime.datetime
+    :param end: End of the time window, unbounded if None
+    :type end: datetime.datetime
+    """
+    connection = apsw.Connection(main_geolifedb)
+    curs = connection.cursor()
+
+    tables = set( x[0] for x in curs.execute("SELECT name FROM sqlite_master WHERE type = 'table'") )
+    if 'geolife_rtree' not in tables:
+        connection.close()
+        buildIndex()
+        connection = apsw.Connection(main_geolifedb)
+        curs = connection.cursor()
+
+    minT = calendar.timegm(start.timetuple()) if start is not None else -2**62
+    maxT = calendar.timegm(end.timetuple()) if end is not None else 2**62
+    startStr = start.strftime(fmt) if start is not None else ''
+    endStr = end.strftime(fmt) if end is not None else '9999'
+
+    rows = curs.execute("""SELECT s.person, s.traj, s.startTime, s.endTime, s.nPoints
+                           FROM geolife_rtree r JOIN geolife_segments s ON s.id = r.id
+                           WHERE r.maxLat >= ? AND r.minLat <= ? AND r.maxLon >= ? AND r.minLon <= ? AND r.maxT >= ? AND r.minT <= ?
+                             AND s.maxLat >= ? AND s.minLat <= ? AND s.maxLon >= ? AND s.minLon <= ? AND s.endTime >= ? AND s.startTime <= ?
+                           ORDER BY s.person, s.traj, s.startTime""",
+                        (minLat, maxLat, minLon, maxLon, minT, maxT, minLat, maxLat, minLon, maxLon, startStr, endStr)).fetchall()
+    connection.close()
+    return rows
+
+def queryTrajectories(minLat, maxLat, minLon, maxLon, start = None, end = None):
+    """
+    Returns a dictionary mapping each person active within the region and time window to the set of
+    their trajectories that are (see querySegments).
+    """
+    rtn = {}
+    for person, traj, _, _, _ in querySegments(minLat, maxLat, minLon, maxLon, start, end):
+        rtn.setdefault(person, set()).add(traj)
+    return rtn
+
+def queryPersons(minLat, maxLat, minLon, maxLon, start = None, end = None):
+    """
+    Returns the sorted list of people active within the region and time window (see querySegments).
+    """
+    return sorted(queryTrajectories(minLat, maxLat, minLon, maxLon, start, end).keys())
+
+def region_cache_path(region_name, spatialRes, temporalRes, scheme = 'healpix'):
+    """
+    Returns the filename of the preprocessing cache restricted to a named region.
+    """
+    return "{}/Region_{}/S{}T{}_{}.sqlite".format(preprocessing_dir, region_name, spatialRes, temporalRes, scheme)
+
+def _region_query(minLat, maxLat, minLon, maxLon, start, end):
+    return (float(minLat), float(maxLat), float(minLon), float(maxLon),
+            start.strftime(fmt) if start is not None else None, end.strftime(fmt) if end is not None else None)
+
+def _cached_region_query(path):
+    curs = open_cache(path).cursor()
+    tables = set( x[0] for x in curs.execute("SELECT name FROM sqlite_master WHERE type = 'table'") )
+    if 'regionQuery' not in tables:
+        return None
+    rows = curs.execute("SELECT minLat, maxLat, minLon, maxLon, start, end FROM regionQuery").fetchall()
+    return tuple(rows[0]) if len(rows) > 0 else None
+
+def stream_region_data(region_name, spatialRes, temporalRes, minLat, maxLat, minLon, maxLon, start = None, end = None, scheme = 'healpix', withDates = False):
+    """
+    Symbolises only the trajectories active within a region and time window, caching the result under
+    the region's name, and returns a generator over the people as GeolifeSymbolisation.stream_geolife_data.
+
+    Whole trajectories are symbolised, on a grid anchored at the first point of each person's first trajectory
+    (whether or not it is in the region), so the symbols are those of the full caches.
+    The region and window are stored in the cache, which is rebuilt if it is reused with different ones.
+
+    :param region_name: Name of the region cache
+    :type region_name: str
+    :param spatialRes: The spatial resolution required for the data.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution required for the data.
+    :type temporalRes: datetime.timedelta
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    :param withDates: True to also yield the time of every symbol
+    :type withDates: Boolean
+    """
+    path = region_cache_path(region_name, spatialRes, temporalRes, scheme)
+    query = _region_query(minLat, maxLat, minLon, maxLon, start, end)
+
+    if os.path.exists(path) and _cached_region_query(path) != query:
+        print "Region {} was cached for a different region or window, rebuilding...".format(region_name)
+        close_cache(path)
+        os.remove(path)
+
+    if not os.path.exists(path):
+        trajectories = queryTrajectories(minLat, maxLat, minLon, maxLon, start, end)
+        if len(trajectories) == 0:
+            raise Exception("Error: No trajectories intersect region {}.".format(region_name))
+
+        ensure_dir(path)
+        buildPreprocessingTable(spatialRes, temporalRes, nest = True, personsIds = sorted(trajectories.keys()), scheme = scheme,
+                                path = path, trajectoriesByPerson = trajectories)
+
+        # record what the cache holds, so reuse with a different region or window is caught
+        connection = apsw.Connection(path)
+        curs = connection.cursor()
+        curs.execute("CREATE TABLE regionQuery (minLat REAL, maxLat REAL, minLon REAL, maxLon REAL, start TEXT, end TEXT)")
+        curs.execute("INSERT INTO regionQuery VALUES (?,?,?,?,?,?)", query)
+        connection.close()
+
+    return iterData(spatialRes, temporalRes, "All", scheme = scheme, withDates = withDates, path = path)
@@ -21,12 +21,16 @@ Created on 22 Oct 2013
 from __future__ import division
 import apsw
 import numpy as np
-import healpy as hp  # @UnresolvedImport
 from datetime import datetime as dt
 from Utils import ensure_dir
 import os
 from multiprocessing import Pool, cpu_count
 from datetime import timedelta
+from SpatialQuantisers import ComputeNside, make_quantiser # ComputeNside is re-exported for existing callers
+from CacheAccess import open_cache, close_cache
+from RunLengthCodec import rle_encode
+import itertools
+import time
 fmt = '%Y-%m-%d %H:%M:%S'
 
 #========
@@ -48,17 +52,63 @@ if '~' in geolife_zipfile_data_dir:
 
 #========
 
+def cache_path(spatialRes, temporalRes, scheme = 'healpix'):
+    """
+    Returns the filename of the preprocessing cache for a spatiotemporal resolution.
+    HEALPix caches keep their original names, other quantisation schemes are suffixed
+    with the scheme name.
+    
+    :param spatialRes: The spatial resolution of the cache.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cache.
+    :type temporalRes: datetime.timedelta
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    if scheme == 'healpix':
+        return "{}/S{}T{}.sqlite".format(preprocessing_dir,spatialRes, temporalRes)
+    return "{}/S{}T{}_{}.sqlite".format(preprocessing_dir,spatialRes, temporalRes, scheme)
+
 def build_specific_cache( spatialRes_temporalRes_pair ):
     spatialRes = spatialRes_temporalRes_pair[0]
     temporalRes = spatialRes_temporalRes_pair[1]
+    scheme = spatialRes_temporalRes_pair[2] if len(spatialRes_temporalRes_pair) > 2 else 'healpix'
     
     print 'Processing spatial res {}, temporal res {}'.format( spatialRes, temporalRes )
     
-    if not os.path.exists( "{}/S{}T{}.sqlite".format(preprocessing_dir,spatialRes, temporalRes) ):
-        buildPreprocessingTable(spatialRes,temporalRes,nest = True)
+    if not os.path.exists( cache_path(spatialRes, temporalRes, scheme) ):
+        buildPreprocessingTable(spatialRes,temporalRes,nest = True, scheme = scheme)
     
+def derive_specific_cache( derivation ):
+    spatialRes, temporalRes, baseTemporalRes, scheme = derivation
+    
+    if not os.path.exists( cache_path(spatialRes, temporalRes, scheme) ):
+        factor = int(temporalRes.total_seconds() // baseTemporalRes.total_seconds())
+        deriveTemporalCache(spatialRes, baseTemporalRes, factor, scheme)
+
+def temporal_derivation_plan(listTemporalRes):
+    """
+    Splits temporal resolutions into those that have to be built from the raw data and those that
+    are an integer multiple of a finer one, and so can be derived from it.
+    
+    Returns the list of base resolutions and a dictionary mapping each derivable resolution to its base.
+    
+    :param listTemporalRes: A list of temporal resolutions
+    :type listTemporalRes: list of datetime.timedelta
+    """
+    bases = []
+    derived = {}
+    for temporalRes in sorted(listTemporalRes):
+        for base in bases:
+            if temporalRes.total_seconds() % base.total_seconds() == 0:
+                derived[temporalRes] = base
+                break
+        else:
+            bases.append(temporalRes)
+    return bases, derived
+
 
-def bulk_build_resolution_cache(listSpatialRes, listTemporalRes, personsId = "All" ):
+def bulk_build_resolution_cache(listSpatialRes, listTemporalRes, personsId = "All", scheme = 'healpix', derive_temporal = False ):
     """
     Bulk builds the spatial/temporal resolution cache files. This can be done on
     the fly but this can not be done in parallel. Since this operation takes a long
@@ -70,15 +120,28 @@ def bulk_build_resolution_cache(listSpatialRes, listTemporalRes, personsId = "Al
     :type listTemporalRes: list of datetime.timedelta
     :param personsId: List of the person IDs for which the data should be fetched.
     :type personsId: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    :param derive_temporal: True to only build the finest temporal resolutions from the raw data and derive
+        the coarser ones that are integer multiples of them (see deriveTemporalCache).
+    :type derive_temporal: Boolean
     """
     
     if not os.path.exists( main_geolifedb ):
         build_main_db()
     
+    if derive_temporal:
+        baseTemporalRes, derivedTemporalRes = temporal_derivation_plan(listTemporalRes)
+    else:
+        baseTemporalRes, derivedTemporalRes = listTemporalRes, {}
+    
     pairs = []
+    derivations = []
     for spatialRes in listSpatialRes:
-        for temporalRes in listTemporalRes:
-            pairs.append( (spatialRes, temporalRes) )
+        for temporalRes in baseTemporalRes:
+            pairs.append( (spatialRes, temporalRes, scheme) )
+        for temporalRes, base in derivedTemporalRes.items():
+            derivations.append( (spatialRes, temporalRes, base, scheme) )
             
             #for debugging
             #build_specific_cache( pairs[-1] )
@@ -86,13 +149,15 @@ def bulk_build_resolution_cache(listSpatialRes, listTemporalRes, personsId = "Al
     
     pool = Pool( processes = cpu_count() - 2 ) # leave some CPU for day to day tasks :-), 2 actual is one real CPU core on a Intel hyperthreaded system
     pool.map(build_specific_cache, pairs ) # the function "match( symbol_idx )" will now be called in parallel with the argument 0,1,... etc.
+    if len(derivations) > 0:
+        pool.map(derive_specific_cache, derivations ) # only once every base cache has been built
     pool.close()
     pool.join()
     
 
 
 
-def get_geolife_data(spatialRes, temporalRes, personsId = "All" ):
+def get_geolife_data(spatialRes, temporalRes, personsId = "All", scheme = 'healpix' ):
     """
     Loads Geolife data for a given spatiotemporal resolution and a specific set of person IDs.
     Builds an SQLite table caching the quantisation from the original dataset if it does not exist.
@@ -103,18 +168,49 @@ def get_geolife_data(spatialRes, temporalRes, personsId = "All" ):
     :type temporalRes: datetime.timedelta
     :param personsId: List of the person IDs for which the data should be fetched.
     :type personsId: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    
+    ensure_cache(spatialRes, temporalRes, personsId, scheme)
+    
+    return loadData(spatialRes, temporalRes, personsId, scheme = scheme )
+
+def stream_geolife_data(spatialRes, temporalRes, personsId = "All", scheme = 'healpix', withDates = False ):
+    """
+    As get_geolife_data, but returns a generator yielding (person ID, symbol array) one person at a time
+    (see iterData), so that only a single trajectory is held in memory.
+    
+    :param spatialRes: The spatial resolution required for the data.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution required for the data.
+    :type temporalRes: datetime.timedelta
+    :param personsId: List of the person IDs for which the data should be fetched.
+    :type personsId: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    :param withDates: True to also yield the time of every symbol
+    :type withDates: Boolean
+    """
+    
+    ensure_cache(spatialRes, temporalRes, personsId, scheme)
+    
+    return iterData(spatialRes, temporalRes, personsId, scheme = scheme, withDates = withDates )
+
+def ensure_cache(spatialRes, temporalRes, personsId = "All", scheme = 'healpix' ):
+    """
+    Builds the preprocessing cache for a spatiotemporal resolution (and if required the main database)
+    if it does not exist.
     """
     
-    if not os.path.exists( "{}/S{}T{}.sqlite".format(preprocessing_dir,spatialRes, temporalRes) ):
+    if not os.path.exists( cache_path(spatialRes, temporalRes, scheme) ):
         if not os.path.exists( main_geolifedb ):
             build_main_db()
         else:
             # ensure it has the table we need in it
             pass
             
-        buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds=personsId)
-    
-    return loadData(spatialRes, temporalRes, personsId )
+        buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds=personsId, scheme = scheme)
 
 
 
@@ -122,14 +218,13 @@ def get_geolife_data(spatialRes, temporalRes, personsId = "All" ):
 #        Helper methods
 
 #load preprocessing data  from the data base :
-def loadData(spatialRes, temporalRes, personsId = "All", withDates = False):
+def loadData(spatialRes, temporalRes, personsId = "All", withDates = False, scheme = 'healpix'):
     print "loading..."
     
-    connection = apsw.Connection("{}/S{}T{}.sqlite".format(preprocessing_dir,spatialRes, temporalRes))
+    connection = open_cache(cache_path(spatialRes, temporalRes, scheme))
     
     curs1 = connection.cursor()
     curs2 = connection.cursor()
-    curs3 = connection.cursor()
     
     data =[]
 #    idPerson = []
@@ -147,21 +242,16 @@ def loadData(spatialRes, temporalRes, personsId = "All", withDates = False):
         data.append([])
 #        idPerson.append(person)
         
-        sql = "SELECT DISTINCT traj FROM preproc WHERE person = {} AND NOT datetime = '' GROUP BY traj".format(person)
-        trajectories = curs2.execute(sql).fetchall()
+        # one pass over the covering index for all of the person's trajectories
+        sql = "SELECT traj, idxPix, datetime FROM preproc WHERE person = ? AND NOT datetime = '' ORDER BY traj, datetime"
+        rows = curs2.execute(sql, (person,)).fetchall()
         
-        if len(trajectories) == 0:
+        if len(rows) == 0:
             raise Exception("Error: The cache did not have the requested person ID. This is most likely because the bulk cache building method was used, which is hardcoded to only load the person IDs used in the PERCOM paper.")
         
         t_ct = 0
-        for t in trajectories:
-            traj = t[0]
-            
-            sql = "SELECT idxPix, datetime FROM preproc WHERE person = {} AND traj = {} ORDER BY datetime".format(person,traj)
-            rows = curs3.execute(sql)
-            
-            data[-1].append(list(rows))#map(lambda x: x[0],rows))
-#            data[-1].append(-1)
+        for _, traj_rows in itertools.groupby(rows, lambda r: r[0]):
+            data[-1].append([(r[1], r[2]) for r in traj_rows])
             t_ct += 1
         
 #        data[-1].pop()
@@ -182,34 +272,58 @@ def loadData(spatialRes, temporalRes, personsId = "All", withDates = False):
     print "Data loaded"
     return np.array(rtn), personsId
 
+def iterData(spatialRes, temporalRes, personsId = "All", scheme = 'healpix', withDates = False, path = None):
+    """
+    Generator version of loadData, yielding (person ID, symbol array) for one person at a time,
+    or (person ID, symbol array, datetime64 array) if withDates is True.
+    Each person's trajectories are concatenated in the same order as loadData.
+    
+    :param spatialRes: The spatial resolution of the cache.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cache.
+    :type temporalRes: datetime.timedelta
+    :param personsId: List of the person IDs for which the data should be fetched.
+    :type personsId: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    :param withDates: True to also yield the time of every symbol
+    :type withDates: Boolean
+    :param path: Filename of the cache, if not the standard one for the resolution (e.g. a region cache, see GeolifeIndex.py)
+    :type path: str
+    """
+    if path is None:
+        path = cache_path(spatialRes, temporalRes, scheme)
+    connection = open_cache(path)
+    curs = connection.cursor()
+    
+    if(personsId == "All"):
+        personsId = [ x[0] for x in curs.execute("SELECT DISTINCT person FROM preproc GROUP BY person ") ]
+    
+    for person in personsId:
+        rows = curs.execute("SELECT idxPix, datetime FROM preproc WHERE person = ? AND NOT datetime = '' ORDER BY traj, datetime", (person,)).fetchall()
+        
+        if len(rows) == 0:
+            raise Exception("Error: The cache did not have the requested person ID. This is most likely because the bulk cache building method was used, which is hardcoded to only load the person IDs used in the PERCOM paper.")
+        
+        symbols = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        if withDates:
+            yield person, symbols, np.asarray([r[1] for r in rows], dtype='datetime64[s]')
+        else:
+            yield person, symbols
+        del rows
+    
+    curs.close()
 
 
-#Computation of Nside, corresponding to the spatial resolution :
-def ComputeNside(spatialRes):
-    i = 0
-    listRes = []
-    listNpix = []
-    while True :
-        listNpix.append(hp.nside2npix(2**i))
-        listRes.append(510072000000000//listNpix[i])
-    #     print "{} : Npix = {} ; approxRes = {}".format(i,listNpix[-1],listRes[-1]) 
-        if listRes[-1] < spatialRes :
-            break
-        i += 1
-    
-    #find the nearest value :
-    listRes = np.asarray(listRes)#Convertion into an numpy array :
-    idx = (np.abs(listRes-spatialRes)).argmin()
-    nearestSpatialRes = listRes[idx]
-    npix = listNpix[idx]
-    nside = hp.npix2nside(npix)
-    print "nearestSpatialRes = {}, Npix = {} and Nside = {}".format(nearestSpatialRes, npix, nside)
-    return nside
 
-def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0, 1, 2, 3, 4, 5, 7, 9, 12, 13, 14, 15, 16, 17, 22, 24, 153, 28, 30, 35, 36, 38, 39, 40, 43, 44, 50, 179, 52, 55, 68, 71, 82, 84, 85, 92, 96, 101, 104, 167, 119, 126]):
+def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0, 1, 2, 3, 4, 5, 7, 9, 12, 13, 14, 15, 16, 17, 22, 24, 153, 28, 30, 35, 36, 38, 39, 40, 43, 44, 50, 179, 52, 55, 68, 71, 82, 84, 85, 92, 96, 101, 104, 167, 119, 126], scheme = 'healpix', path = None, trajectoriesByPerson = None):
 
     data = []
-    nside = ComputeNside(spatialRes)
+    anchors = []
+    if scheme == 'healpix':
+        quantiser = make_quantiser(scheme, spatialRes, nest = nest)
+    else:
+        quantiser = make_quantiser(scheme, spatialRes)
    
     #connection to the DataBase :
     connectionOrig=apsw.Connection(main_geolifedb)
@@ -230,9 +344,6 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
 #     writingCurs.execute(sql)
     writingCurs.execute("CREATE TABLE preproc (person INT, traj INT, idxPix INT, datetime TEXT)")
     
-    def getIdxPix(longitude, latitude):
-        return hp.ang2pix(nside, (90 - latitude) * np.pi / 180, longitude * np.pi / 180, nest)
-    
     fmt = '%Y-%m-%d %H:%M:%S'
     
     if isinstance(personsIds, str) and personsIds.lower() == 'all':
@@ -251,18 +362,34 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
     #    AND traj = 20090426211055
         trajectories = curs2.execute(sql)
         
-        
         prev = 0
         t_ct = 0
+        
+        if trajectoriesByPerson is not None:
+            # only symbolise the requested trajectories (e.g. those found by a GeolifeIndex query)
+            trajectories = trajectories.fetchall()
+            wanted = trajectoriesByPerson.get(person, ())
+            if len(trajectories) > 0 and trajectories[0][0] not in wanted:
+                # The grid is anchored at the first point of the person's first trajectory. At the start of every
+                # later trajectory it only depends on that anchor, so starting from it gives the same grid as the full cache.
+                sql = "SELECT MIN(datetime) FROM geolife WHERE person = {} AND NOT datetime = '' AND traj = {}".format(person,trajectories[0][0])
+                anchor = curs1.execute(sql).fetchall()[0][0]
+                anchors.append((person, anchor))
+                nextTime = dt.strptime(anchor,fmt)
+                t_ct = 1
+            trajectories = [t for t in trajectories if t[0] in wanted]
+        
         #for each trajectories
         for t in trajectories:
             #select the first element of the tuple given by sqlite:
             traj = t[0]
             #make a sql query for 
             sql = "SELECT longitude ,latitude , datetime FROM geolife WHERE person = {} AND NOT datetime = '' AND traj = {} ORDER BY datetime".format(person,traj)
-            rows = curs1.execute(sql)
-            
+            rows = curs1.execute(sql).fetchall()
             
+            # quantise the whole trajectory at once, idxPix[ct] is the symbol of rows[ct]
+            if len(rows) > 0:
+                idxPix = quantiser.quantise([row[0] for row in rows], [row[1] for row in rows])
             
             ct = 0
             points = []
@@ -275,7 +402,8 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
                     if t_ct == 0 :
                         #If it's the first trajectory of the person, just set the time origin at the first point
                         nextTime = actualTime
-                        points.append((person,traj,int(getIdxPix(row[0],row[1])),nextTime.strftime(fmt)))
+                        anchors.append((person, nextTime.strftime(fmt)))
+                        points.append((person,traj,int(idxPix[ct]),nextTime.strftime(fmt)))
                         nextTime += temporalRes
                         
                     else :
@@ -293,11 +421,11 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
                     #This one: 
                     if abs(nextTime - actualTime) < abs(nextTime - dt.strptime(prev[2],fmt)):
                         #record the point :
-                        points.append((person,traj,int(getIdxPix(row[0],row[1])),nextTime.strftime(fmt)))
+                        points.append((person,traj,int(idxPix[ct]),nextTime.strftime(fmt)))
                     #Or the previous one ?
                     else :
                         #record the point :
-                        points.append((person,traj,int(getIdxPix(prev[0],prev[1])),nextTime.strftime(fmt)))
+                        points.append((person,traj,int(idxPix[ct-1]),nextTime.strftime(fmt)))
                     nextTime += temporalRes
                 
                     
@@ -312,17 +440,66 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
             print "S: {} T: {} Person {}: {} trajectories processed".format( spatialRes,temporalRes, person, t_ct )
 
     #writing the informations about the sample :
-    writingCurs.execute("CREATE TABLE infoSample (nside INT)")
-    sql = "INSERT INTO infoSample VALUES ({})".format(nside)
-    writingCurs.execute(sql)
+    info = quantiser.info()
+    writingCurs.execute("CREATE TABLE infoSample (nside INT, scheme TEXT, params TEXT)")
+    writingCurs.execute("INSERT INTO infoSample VALUES (?,?,?)", (info['nside'], info['scheme'], info['params']))
+    
+    # the time origin of each person's resampling grid, needed to derive coarser temporal resolutions
+    writingCurs.execute("CREATE TABLE personAnchor (person INT PRIMARY KEY, datetime TEXT)")
+    writingCurs.executemany("INSERT INTO personAnchor VALUES (?,?)", anchors)
+    
+    if path is None:
+        path = cache_path(spatialRes, temporalRes, scheme)
+    _write_cache(writingConn, path)
+
+# Indexes of the preproc table. Every read is by person in (traj, datetime) order, which the covering
+# index answers without touching the table. The legacy layout is kept for benchmarkCacheLayouts.
+cache_indexes = {'covering' : """CREATE INDEX IF NOT EXISTS idx_person_traj_datetime_preproc ON preproc(person,traj,datetime,idxPix);""",
+                 'legacy' : """CREATE INDEX IF NOT EXISTS idx_person_preproc ON preproc(person);
+                               CREATE INDEX IF NOT EXISTS idx_person_traj_preproc ON preproc(person,traj);
+                               CREATE INDEX IF NOT EXISTS idx_traj_preproc ON preproc(traj);
+                               CREATE INDEX IF NOT EXISTS idx_traj_datetime_preproc ON preproc(traj,datetime);"""}
+
+def _to_blob(a):
+    return buffer(np.ascontiguousarray(a, dtype=np.int64).tostring())
+
+def _add_run_length_table(writingConn):
+    """
+    Adds the preproc_rle table (see RunLengthEncoding.py), one row of runs per person, to an in-memory
+    preprocessing database. Each person's trajectories are concatenated in the same order as loadData.
+    """
+    writingCurs = writingConn.cursor()
+    rows = writingCurs.execute("SELECT person, idxPix FROM preproc WHERE NOT datetime = '' ORDER BY person, traj, datetime").fetchall()
+    records = []
+    if len(rows) > 0:
+        persons = np.asarray([r[0] for r in rows], dtype=np.int64)
+        symbols = np.asarray([r[1] for r in rows], dtype=np.int64)
+        bounds = np.concatenate(([0], np.flatnonzero(persons[1:] != persons[:-1]) + 1, [len(persons)]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            values, lengths = rle_encode(symbols[start:end])
+            records.append((int(persons[start]), len(values), int(end - start), _to_blob(values), _to_blob(lengths)))
+    
+    writingCurs.execute("DROP TABLE IF EXISTS preproc_rle")
+    writingCurs.execute("CREATE TABLE preproc_rle (person INT PRIMARY KEY, nRuns INT, nSymbols INT, symbols BLOB, lengths BLOB)")
+    writingCurs.executemany("INSERT INTO preproc_rle VALUES (?,?,?,?,?)", records)
+    writingCurs.close()
+    print "{} persons encoded, {} symbols in {} runs".format(len(records), sum(r[2] for r in records), sum(r[1] for r in records))
+
+def _write_cache(writingConn, path, layout = 'covering'):
+    """
+    Adds the run length table, indexes an in-memory preprocessing database and writes it out to path in one go.
+    
+    The file is written under a temporary name and renamed over path, so a cache is never modified in place:
+    readers open caches immutable (see CacheAccess.py), and any still reading the old file keep reading it.
+    """
+    print "Run length encoding..."
+    _add_run_length_table(writingConn)
+    
+    writingCurs = writingConn.cursor()
     
     #Creating index :
     print "Creating index..."
-    sql = """CREATE INDEX idx_person_preproc ON preproc(person);
-         CREATE INDEX idx_person_traj_preproc ON preproc(person,traj);
-         CREATE INDEX idx_traj_preproc ON preproc(traj);
-         CREATE INDEX idx_traj_datetime_preproc ON preproc(traj,datetime);"""
-    writingCurs.execute(sql)
+    writingCurs.execute(cache_indexes[layout])
    
    
     print "Cleaning up..."
@@ -333,20 +510,243 @@ def buildPreprocessingTable(spatialRes,temporalRes,nest = True, personsIds = [0,
     
     
     #Create the database file 
-    filename = "S{}T{}.sqlite".format(spatialRes, temporalRes)
-    path = preprocessing_dir + "/" + filename
     ensure_dir(path)
-    f = open(path, 'w')
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'w')
     f.close()   
     # Now write out the database back to a file in one go
     
 
-    connection=apsw.Connection(path)
+    connection=apsw.Connection(tmp_path)
     with connection.backup("main", writingConn, "main") as backup:
         backup.step() # copy whole database in one go
+    connection.close()
+    
+    close_cache(path)
+    os.rename(tmp_path, path)
 
     print "Done"
 
+def deriveTemporalCache(spatialRes, baseTemporalRes, factor, scheme = 'healpix'):
+    """
+    Builds the cache for the temporal resolution factor * baseTemporalRes by decimating the existing
+    baseTemporalRes cache, rather than resampling the raw GPS data again.
+    
+    Both resolutions resample a person onto a regular grid anchored at their first fix, so the coarse
+    grid times are every factor-th fine grid time, and for a grid time common to both the nearest-point
+    rule picks from the same two fixes. The result is however not always identical to building the
+    cache from the raw data:
+    
+    * buildPreprocessingTable emits at most one grid point per GPS fix, so after a gap within a
+      trajectory the emitted grid times lag behind the fixes, and by a different amount at each resolution.
+    * Caches built before the personAnchor table existed fall back to each person's earliest cached
+      time, which is not their anchor if their first trajectory was dropped for having a single point.
+    
+    Use verifyDerivedCache to report the differences against a cache built from the raw data.
+    
+    :param spatialRes: The spatial resolution of the caches.
+    :type spatialRes: int denoting meters
+    :param baseTemporalRes: The temporal resolution of the existing cache.
+    :type baseTemporalRes: datetime.timedelta
+    :param factor: The integer ratio between the new and existing temporal resolutions.
+    :type factor: int
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    temporalRes = baseTemporalRes * factor
+    base_path = cache_path(spatialRes, baseTemporalRes, scheme)
+    if not os.path.exists( base_path ):
+        raise Exception("Error: Cannot derive S{}T{} as the cache it is derived from ({}) does not exist.".format(spatialRes, temporalRes, base_path))
+    
+    print 'Deriving s: {} t: {} from t: {}'.format(spatialRes, temporalRes, baseTemporalRes)
+    
+    connection = open_cache(base_path)
+    curs = connection.cursor()
+    
+    tables = set( x[0] for x in curs.execute("SELECT name FROM sqlite_master WHERE type = 'table'") )
+    if 'personAnchor' in tables:
+        anchors = curs.execute("SELECT person, datetime FROM personAnchor").fetchall()
+    else:
+        print "Warning: {} has no personAnchor table, using each person's earliest cached time as their grid origin.".format(base_path)
+        anchors = curs.execute("SELECT person, MIN(datetime) FROM preproc GROUP BY person").fetchall()
+    info = list(curs.execute("SELECT * FROM infoSample").fetchall()[0])
+    info = info + [None] * (3 - len(info)) # caches predating the scheme columns are HEALPix
+    if info[1] is None:
+        info[1] = 'healpix'
+    
+    rows = curs.execute("SELECT person, traj, idxPix, datetime FROM preproc ORDER BY person, traj, datetime").fetchall()
+    curs.close()
+    
+    kept = []
+    if len(rows) > 0:
+        persons = np.asarray([r[0] for r in rows], dtype=np.int64)
+        trajs = np.asarray([r[1] for r in rows], dtype=np.int64)
+        times = np.asarray([r[3] for r in rows], dtype='datetime64[s]')
+        
+        anchor_of = dict(anchors)
+        unique_persons, person_idx = np.unique(persons, return_inverse=True)
+        person_anchor = np.asarray([anchor_of[p] for p in unique_persons], dtype='datetime64[s]')
+        offsets = (times - person_anchor[person_idx]).astype(np.int64)
+        
+        step = int(baseTemporalRes.total_seconds())
+        keep = (offsets % (step * factor)) == 0
+        
+        # as when building from the raw data, trajectories with a single point are dropped
+        new_traj = np.concatenate(([True], (persons[1:] != persons[:-1]) | (trajs[1:] != trajs[:-1])))
+        traj_idx = np.cumsum(new_traj) - 1
+        kept_ct = np.bincount(traj_idx[keep], minlength=traj_idx[-1] + 1)
+        keep &= kept_ct[traj_idx] > 1
+        
+        kept = [rows[i] for i in np.flatnonzero(keep)]
+    
+    writingConn = apsw.Connection(":memory:")
+    writingCurs = writingConn.cursor()
+    writingCurs.execute("CREATE TABLE preproc (person INT, traj INT, idxPix INT, datetime TEXT)")
+    writingCurs.executemany("INSERT INTO preproc (person,traj,idxPix,datetime) VALUES (?,?,?,?)", kept)
+    writingCurs.execute("CREATE TABLE infoSample (nside INT, scheme TEXT, params TEXT)")
+    writingCurs.execute("INSERT INTO infoSample VALUES (?,?,?)", info[:3])
+    writingCurs.execute("CREATE TABLE personAnchor (person INT PRIMARY KEY, datetime TEXT)")
+    writingCurs.executemany("INSERT INTO personAnchor VALUES (?,?)", anchors)
+    writingCurs.execute("CREATE TABLE derivation (baseTemporalRes TEXT, factor INT)")
+    writingCurs.execute("INSERT INTO derivation VALUES (?,?)", (str(baseTemporalRes), factor))
+    
+    print "S: {} T: {}: kept {} of {} points".format(spatialRes, temporalRes, len(kept), len(rows))
+    
+    _write_cache(writingConn, cache_path(spatialRes, temporalRes, scheme))
+
+def compareCaches(path_a, path_b, personsId = "All"):
+    """
+    Reports the differences between the preproc tables of two caches, matching points on (person, traj, datetime).
+    
+    Returns a dictionary with the number of points only in a, only in b, in both but with a different
+    symbol, and in both with the same symbol, along with the same counts per person.
+    
+    :param path_a: Filename of the first cache
+    :type path_a: str
+    :param path_b: Filename of the second cache
+    :type path_b: str
+    :param personsId: List of the person IDs to compare, or "All"
+    :type personsId: List of ints
+    """
+    def load(path):
+        rows = open_cache(path).cursor().execute("SELECT person, traj, datetime, idxPix FROM preproc").fetchall()
+        if not personsId == "All":
+            wanted = set(personsId)
+            rows = [r for r in rows if r[0] in wanted]
+        return dict( ((r[0], r[1], r[2]), r[3]) for r in rows )
+    
+    a = load(path_a)
+    b = load(path_b)
+    
+    per_person = {}
+    def count(key, kind):
+        per_person.setdefault(key[0], {'only_a' : 0, 'only_b' : 0, 'mismatch' : 0, 'same' : 0})[kind] += 1
+    
+    for key in a:
+        if key not in b:
+            count(key, 'only_a')
+        elif a[key] != b[key]:
+            count(key, 'mismatch')
+        else:
+            count(key, 'same')
+    for key in b:
+        if key not in a:
+            count(key, 'only_b')
+    
+    summary = dict( (kind, sum(c[kind] for c in per_person.values())) for kind in ['only_a','only_b','mismatch','same'] )
+    summary['per_person'] = per_person
+    
+    print "Comparing {} with {}: {} same, {} differing symbols, {} only in the first, {} only in the second".format(
+                path_a, path_b, summary['same'], summary['mismatch'], summary['only_a'], summary['only_b'])
+    for person in sorted(per_person):
+        c = per_person[person]
+        if c['only_a'] or c['only_b'] or c['mismatch']:
+            print "\tPerson {}: {} differing symbols, {} only in the first, {} only in the second".format(person, c['mismatch'], c['only_a'], c['only_b'])
+    
+    return summary
+
+def verifyDerivedCache(spatialRes, temporalRes, personsIds = None, scheme = 'healpix'):
+    """
+    Builds a reference cache from the raw data for a derived resolution and reports how it differs
+    from the derived cache (see deriveTemporalCache). The reference cache is removed afterwards.
+    
+    :param spatialRes: The spatial resolution of the derived cache.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the derived cache.
+    :type temporalRes: datetime.timedelta
+    :param personsIds: List of the person IDs to build the reference for and compare, or "All".
+        Defaults to the people in the derived cache (bulk built caches only hold the PERCOM IDs).
+    :type personsIds: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    derived_path = cache_path(spatialRes, temporalRes, scheme)
+    reference_path = derived_path + '.reference'
+    if personsIds is None:
+        curs = open_cache(derived_path).cursor()
+        personsIds = [ x[0] for x in curs.execute("SELECT DISTINCT person FROM preproc ORDER BY person") ]
+        curs.close()
+    buildPreprocessingTable(spatialRes, temporalRes, nest = True, personsIds = personsIds, scheme = scheme, path = reference_path)
+    try:
+        return compareCaches(derived_path, reference_path, personsIds)
+    finally:
+        close_cache(reference_path)
+        os.remove(reference_path)
+
+def benchmarkCacheLayouts(spatialRes, temporalRes, scheme = 'healpix', repeats = 3):
+    """
+    Compares the file size and the time to load every person (see iterData) of an existing cache
+    written with each index layout of cache_indexes. Copies of the cache are written next to it
+    for the comparison and removed afterwards.
+    
+    Returns a dictionary keyed by layout of {'bytes' : file size, 'load_seconds' : fastest load}.
+    
+    :param spatialRes: The spatial resolution of the cache.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cache.
+    :type temporalRes: datetime.timedelta
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    :param repeats: Number of times each layout is loaded
+    :type repeats: int
+    """
+    path = cache_path(spatialRes, temporalRes, scheme)
+    if not os.path.exists( path ):
+        raise Exception("Error: Cannot benchmark S{}T{} as its cache ({}) does not exist.".format(spatialRes, temporalRes, path))
+    
+    results = {}
+    for layout in sorted(cache_indexes):
+        layout_path = "{}.{}".format(path, layout)
+        
+        # copy the cache into memory without its indexes and write it out with this layout
+        writingConn = apsw.Connection(":memory:")
+        with writingConn.backup("main", open_cache(path), "main") as backup:
+            backup.step()
+        writingCurs = writingConn.cursor()
+        indexes = [x[0] for x in writingCurs.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'preproc' AND sql IS NOT NULL").fetchall()]
+        for index in indexes:
+            writingCurs.execute("DROP INDEX {}".format(index))
+        writingCurs.close()
+        _write_cache(writingConn, layout_path, layout)
+        writingConn.close()
+        
+        try:
+            load_seconds = []
+            for _ in range(repeats):
+                close_cache(layout_path)
+                t = time.time()
+                for _ in iterData(spatialRes, temporalRes, "All", withDates = True, path = layout_path):
+                    pass
+                load_seconds.append(time.time() - t)
+            results[layout] = {'bytes' : os.path.getsize(layout_path), 'load_seconds' : min(load_seconds)}
+        finally:
+            close_cache(layout_path)
+            os.remove(layout_path)
+        
+        print "S: {} T: {} {} layout: {} bytes, loaded in {:.3f} seconds".format(spatialRes, temporalRes, layout, results[layout]['bytes'], results[layout]['load_seconds'])
+    
+    return results
+
 
 
 def build_main_db():
@@ -20,7 +20,12 @@ Created on 30 Sep 2013
 
 from __future__ import division
 import numpy as np
-import pylab as pl
+import glob
+import hashlib
+import os
+from multiprocessing import Pool, cpu_count
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 
 # These are hard-coded labels and correspond to hard-coded array in other parts of the code.
@@ -31,6 +36,9 @@ listRealSpatialRes = ['$618m^{2}$\n($35m$)','$2474m^{2}$\n($70m$)','$9896m^{2}$\
          
 listTemporalRes = ['0:05:00','0:10:00','0:15:00','0:30:00','0:45:00','1:00:00']
 
+# Change to re-render figures whose inputs are unchanged, when the way they are drawn changes
+RENDER_VERSION = 1
+
 def plot_map( LoP, LoPB, num_ppl, output_path_and_filename, diff_map ):
     """
     Plots an individual heatmap
@@ -58,49 +66,140 @@ def plot_map( LoP, LoPB, num_ppl, output_path_and_filename, diff_map ):
     
     # to percent for viewing
     LoP = np.array(LoP)*100
+    LoPB = np.asarray(LoPB)
     
-    f = pl.figure()    
+    # A figure on its own Agg canvas, not registered with pyplot, so it is freed once it is saved
+    f = Figure()
+    FigureCanvasAgg(f)
     ax = f.add_subplot(111)
 
         
-    pl.pcolor(LoP,vmin=scale[0], vmax=scale[1])
-    for y in range(LoP.shape[0]):
-        for x in range(LoP.shape[1]):
-            if LoPB[y,x] != 0:
-                txt = '{:2.2f}\n({})'.format(LoP[y, x], int(num_ppl-LoPB[y,x]))
-            else:
-                txt = '{:2.2f}'.format(LoP[y, x])
-            pl.text(x + 0.5, y + 0.5, txt, horizontalalignment='center', verticalalignment='center')
+    mesh = ax.pcolormesh(LoP,vmin=scale[0], vmax=scale[1])
+    
+    # cell labels, with the number of people computed for in brackets where some failed
+    labels = np.char.mod('%2.2f', LoP)
+    labels = np.where(LoPB != 0, np.char.add(labels, np.char.mod('\n(%d)', (num_ppl-LoPB).astype(int))), labels)
+    ys, xs = np.indices(LoP.shape)
+    for x, y, txt in zip(xs.ravel() + 0.5, ys.ravel() + 0.5, labels.ravel()):
+        ax.text(x, y, txt, horizontalalignment='center', verticalalignment='center')
             
     v = np.arange(scale[0], scale[1]+0.01, scale[2])
-    pl.colorbar(ticks=v)
+    f.colorbar(mesh, ax=ax, ticks=v)
     tx = [0,1,1,2,2,3,3,4,4,5,5,6]
 
     ty = np.asarray([4,4,5,5,6,6,7,7,7,7,8,8])
-    pl.fill_between(tx, ty,ty, linewidth = 5)
+    ax.fill_between(tx, ty,ty, linewidth = 5)
    
         
-    pl.xticks(np.arange(LoP.shape[1])+0.5)
-    pl.yticks(np.arange(LoP.shape[0])+0.5)
-    pl.ylabel("Spatial Resolution (max. straight line distance across region)")
+    ax.set_xticks(np.arange(LoP.shape[1])+0.5)
+    ax.set_yticks(np.arange(LoP.shape[0])+0.5)
+    ax.set_ylabel("Spatial Resolution (max. straight line distance across region)")
     ax.set_yticklabels(listRealSpatialRes)
     ax.set_xticklabels(listTemporalRes,rotation=20)
-    pl.xlabel('Temporal Resolution (hour:min:sec)')
+    ax.set_xlabel('Temporal Resolution (hour:min:sec)')
     
     # 0 = diff
     # 1 = RL
     # 2 = DL
     if diff_map == 0:
-        pl.title('Reduction in upper bound achieved (difference in Mean predictability (%))\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
+        ax.set_title('Reduction in upper bound achieved (difference in Mean predictability (%))\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
     elif diff_map == 1:
-        pl.title('Mean potential predictability (%) via refined method (this work)\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
+        ax.set_title('Mean potential predictability (%) via refined method (this work)\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
     elif diff_map == 2:
-        pl.title('Mean potential predictability (%) via original method\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
+        ax.set_title('Mean potential predictability (%) via original method\n({} people unless otherwise noted within a cell in brackets)'.format(num_ppl))
     
-    f.savefig(output_path_and_filename[:-4] + ".pdf", filetype='pdf', bbox_inches='tight')
+    f.savefig(output_path_and_filename[:-4] + ".pdf", format='pdf', bbox_inches='tight')
 
+def _input_digest( input_files, num_ppl, diff_map ):
+    h = hashlib.md5()
+    for input_file in input_files:
+        with open(input_file, 'rb') as f:
+            h.update(f.read())
+    h.update('{} {} {}'.format(num_ppl, diff_map, RENDER_VERSION))
+    return h.hexdigest()
 
+def _render_job( job ):
+    """
+    Renders one heatmap of a batch, returns (output file, True if it was rendered or False if it was unchanged).
+    """
+    file_name, DL_RL, num_ppl, force = job
+    diff_map = {'DLmRL' : 0, 'RL' : 1, 'DL' : 2}[DL_RL]
+    inputs = [file_name + 'DL.csv', file_name + 'RL.csv'] if diff_map == 0 else [file_name + DL_RL + '.csv']
+    inputs.append(file_name + '_failed_ct.csv')
+    
+    output_file = file_name + DL_RL + '.pdf'
+    digest_file = output_file + '.md5'
+    digest = _input_digest(inputs, num_ppl, diff_map)
+    if not force and os.path.exists(output_file) and os.path.exists(digest_file):
+        with open(digest_file) as f:
+            if f.read().strip() == digest:
+                return output_file, False
+    
+    LoP = [np.genfromtxt(input_file,skip_header=0) for input_file in inputs[:-1]]
+    LoPB = np.genfromtxt(inputs[-1],skip_header=0)
+    if diff_map == 0:
+        LoP = LoP[0] - LoP[1]
+    else:
+        LoP = LoP[0]
+    plot_map(LoP, LoPB, num_ppl, output_file, diff_map)
     
+    with open(digest_file, 'w') as f:
+        f.write(digest)
+    return output_file, True
+
+def find_heatmaps( output_dir ):
+    """
+    Returns the base filenames (as GeolifeEntropyCalc.group_file_name) of every group with heatmap CSVs in output_dir.
+    
+    :param output_dir: Directory the heatmap CSVs were written to
+    :type output_dir: str
+    """
+    file_names = []
+    for RL_file in sorted(glob.glob(os.path.join(output_dir, 'Heatmap_*RL.csv'))):
+        file_name = RL_file[:-len('RL.csv')]
+        if os.path.exists(file_name + 'DL.csv') and os.path.exists(file_name + '_failed_ct.csv'):
+            file_names.append(file_name)
+    return file_names
+
+def render_heatmaps( output_dir, num_ppl, maps = ('RL', 'DL', 'DLmRL'), processes = None, force = False ):
+    """
+    Renders the heatmaps of every group in output_dir across a process pool, as <base filename><map>.pdf
+    next to the CSVs (e.g. Heatmap_GrpPERCOMRL.pdf).
+    
+    A digest of the inputs of each figure is kept beside it (<figure>.md5), and figures whose inputs are
+    unchanged since they were last rendered are skipped. Returns the list of figures rendered.
+    
+    :param output_dir: Directory the heatmap CSVs were written to
+    :type output_dir: str
+    :param num_ppl: Number of people in each group, either one for all groups or a dictionary keyed by the group's filename suffix (e.g. 'GrpPERCOM', 'All')
+    :type num_ppl: int or dict
+    :param maps: Which of the refined (RL), original (DL) and difference (DLmRL) maps to render
+    :type maps: sequence of str
+    :param processes: Number of worker processes, defaults to the number of CPUs less 2
+    :type processes: int
+    :param force: True to render every figure even if its inputs are unchanged
+    :type force: Boolean
+    """
+    jobs = []
+    for file_name in find_heatmaps(output_dir):
+        suffix = os.path.basename(file_name)[len('Heatmap_'):]
+        n = num_ppl[suffix] if isinstance(num_ppl, dict) else num_ppl
+        jobs.extend((file_name, DL_RL, n, force) for DL_RL in maps)
+    
+    if len(jobs) == 0:
+        return []
+    
+    if processes is None:
+        processes = max(cpu_count() - 2, 1) # leave some CPU for day to day tasks
+    
+    pool = Pool( processes = min(processes, len(jobs)) )
+    results = pool.map(_render_job, jobs)
+    pool.close()
+    pool.join()
+    
+    rendered = [output_file for output_file, changed in results if changed]
+    print "Rendered {} heatmaps, {} unchanged".format(len(rendered), len(results) - len(rendered))
+    return rendered
 
 if __name__ == '__main__':
     """
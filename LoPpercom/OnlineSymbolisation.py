@@ -0,0 +1,165 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Online resampling of live GPS fixes into location symbols.
+
+Applies the same rules as GeolifeSymbolisation.buildPreprocessingTable as fixes
+arrive, keeping only a small state per user and temporal resolution (the next grid
+time and the previous fix):
+
+* The grid of a user is anchored at their first fix and advances by the temporal resolution.
+* Within a trajectory, the first fix after a grid time emits the symbol of whichever of it
+  and the previous fix is nearest to that grid time (at most one grid point per fix).
+* At the start of a later trajectory the grid skips forward to the first grid time after its first fix.
+* Trajectories with a single emitted point are dropped, so the first point of each trajectory
+  is held back until a second one is emitted.
+
+Fixes are ingested in batches: every batch is quantised with one vectorised call per
+spatial resolution and all the temporal resolutions are advanced together. ingest only
+does CPU work on its arguments, so it can be called from any event loop driving the feed.
+'''
+
+from __future__ import division
+import numpy as np
+from datetime import datetime as dt
+from SpatialQuantisers import make_quantiser
+fmt = '%Y-%m-%d %H:%M:%S'
+
+class _ResamplerState(object):
+    """
+    Resampling state of one user at one temporal resolution.
+    """
+    __slots__ = ('traj', 'nextTime', 'prevTime', 'prevSymbols', 'pending')
+
+    def __init__(self):
+        self.traj = None
+        self.nextTime = None
+        self.prevTime = None
+        self.prevSymbols = None
+        self.pending = None # first point of the current trajectory, until a second is emitted
+
+class OnlineResampler(object):
+    """
+    Resamples the fixes of many users at several spatial and temporal resolutions at once.
+    """
+
+    def __init__(self, listSpatialRes, listTemporalRes, scheme = 'healpix', trajectory_gap = None):
+        """
+        :param listSpatialRes: The spatial resolutions to emit symbols at
+        :type listSpatialRes: list of ints denoting meters
+        :param listTemporalRes: The temporal resolutions to emit symbols at
+        :type listTemporalRes: list of datetime.timedelta
+        :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+        :type scheme: str
+        :param trajectory_gap: For fixes without a trajectory ID, a gap between fixes longer than this starts a new trajectory
+        :type trajectory_gap: datetime.timedelta
+        """
+        self.listSpatialRes = list(listSpatialRes)
+        self.listTemporalRes = list(listTemporalRes)
+        self.quantisers = [make_quantiser(scheme, spatialRes) for spatialRes in self.listSpatialRes]
+        self.trajectory_gap = trajectory_gap
+        self.states = {} # (user, temporalRes index) -> _ResamplerState
+        self.last_fix = {} # user -> (traj, time) of the last fix, for trajectory_gap
+
+    def _trajectory(self, user, traj, time):
+        if traj is not None:
+            return traj
+        if self.trajectory_gap is None:
+            raise Exception("Error: Fixes without a trajectory ID require the OnlineResampler to have a trajectory_gap.")
+        last = self.last_fix.get(user)
+        if last is None:
+            return 0
+        if time - last[1] > self.trajectory_gap:
+            return last[0] + 1
+        return last[0]
+
+    def ingest(self, fixes):
+        """
+        Ingests a batch of fixes and returns the points emitted by them, as a list of
+        (user, traj, spatialRes, temporalRes, idxPix, datetime string) tuples.
+
+        The fixes of each user must arrive in time order (across batches too), and their trajectories
+        in the same order as buildPreprocessingTable reads them.
+
+        :param fixes: (user, traj, longitude, latitude, time) tuples. traj may be None (see trajectory_gap),
+            time is a datetime or a string in the Geolife format.
+        :type fixes: list of tuples
+        """
+        if len(fixes) == 0:
+            return []
+
+        longitude = np.asarray([f[2] for f in fixes], dtype=np.float64)
+        latitude = np.asarray([f[3] for f in fixes], dtype=np.float64)
+        # fix x spatial resolution matrix of symbols
+        symbols = np.column_stack([q.quantise(longitude, latitude) for q in self.quantisers]).tolist()
+
+        emitted = []
+        for fix, fix_symbols in zip(fixes, symbols):
+            user, traj, _, _, time = fix
+            if not isinstance(time, dt):
+                time = dt.strptime(time, fmt)
+            traj = self._trajectory(user, traj, time)
+            self.last_fix[user] = (traj, time)
+
+            for t_idx, temporalRes in enumerate(self.listTemporalRes):
+                state = self.states.get((user, t_idx))
+                if state is None:
+                    state = self.states[(user, t_idx)] = _ResamplerState()
+                self._advance(state, user, traj, time, fix_symbols, temporalRes, emitted)
+
+        return emitted
+
+    def _advance(self, state, user, traj, time, fix_symbols, temporalRes, emitted):
+        point = None
+        if state.traj != traj:
+            # first fix of a trajectory
+            state.pending = None
+            if state.nextTime is None:
+                # first trajectory of the user, this sets the time origin
+                point = (time, fix_symbols)
+                state.nextTime = time + temporalRes
+            else:
+                nb_loc_missing = int((time - state.nextTime).total_seconds()//temporalRes.total_seconds()+1)
+                state.nextTime = nb_loc_missing * temporalRes + state.nextTime
+            state.traj = traj
+        elif time > state.nextTime:
+            if abs(state.nextTime - time) < abs(state.nextTime - state.prevTime):
+                point = (state.nextTime, fix_symbols)
+            else:
+                point = (state.nextTime, state.prevSymbols)
+            state.nextTime += temporalRes
+
+        state.prevTime = time
+        state.prevSymbols = fix_symbols
+
+        if point is None:
+            return
+        if state.pending is None:
+            state.pending = [point]
+            return
+        if len(state.pending) == 1:
+            # the trajectory now has two points, so will be kept
+            self._emit(user, traj, temporalRes, state.pending[0], emitted)
+            state.pending.append(None)
+        self._emit(user, traj, temporalRes, point, emitted)
+
+    def _emit(self, user, traj, temporalRes, point, emitted):
+        time_str = point[0].strftime(fmt)
+        for spatialRes, symbol in zip(self.listSpatialRes, point[1]):
+            emitted.append((user, traj, spatialRes, temporalRes, symbol, time_str))
@@ -0,0 +1,197 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Long-format store of the per-person, per-cell results of a sweep.
+
+Each row holds the values computed for one person at one spatiotemporal
+resolution (S, N_DL, N_RL, the two upper bounds and whether the solve was a
+known failure). Since none of these depend on which group the person was
+evaluated in, any sub-group's heatmaps can be derived from the store without
+reloading the data or re-solving.
+
+A store holds the results of a single spatial quantisation scheme, which it
+records so that results of different schemes are never mixed or overwritten.
+'''
+
+from __future__ import division
+import apsw
+import numpy as np
+from Utils import ensure_dir
+
+def open_store(path, scheme = 'healpix'):
+    """
+    Opens (creating if required) a per-person results store.
+
+    :param path: Filename of the SQLite store
+    :type path: str
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py) of the results
+    :type scheme: str
+    """
+    ensure_dir(path)
+    connection = apsw.Connection(path)
+    curs = connection.cursor()
+    tables = set( x[0] for x in curs.execute("SELECT name FROM sqlite_master WHERE type = 'table'") )
+    curs.execute("""CREATE TABLE IF NOT EXISTS results (spatialRes INT, temporalRes INT, person INT,
+                    S REAL, N_DL INT, N_RL INT, Pi_DL REAL, Pi_RL REAL, failed INT,
+                    PRIMARY KEY (spatialRes, temporalRes, person));
+                    CREATE INDEX IF NOT EXISTS idx_person_results ON results(person);""")
+
+    if 'storeInfo' not in tables:
+        # stores from before the scheme was recorded only ever held HEALPix results
+        store_scheme = scheme if 'results' not in tables else 'healpix'
+        curs.execute("CREATE TABLE storeInfo (scheme TEXT)")
+        curs.execute("INSERT INTO storeInfo VALUES (?)", (store_scheme,))
+    store_scheme = curs.execute("SELECT scheme FROM storeInfo").fetchall()[0][0]
+    if store_scheme != scheme:
+        connection.close()
+        raise Exception("Error: The results store {} holds {} results, not {}. Use a separate store for each scheme.".format(path, store_scheme, scheme))
+    return connection
+
+def record_cell(connection, spatialRes, temporalRes, person_ids, S, N_DL, N_RL, Pi_DL, Pi_RL):
+    """
+    Writes the per-person results of a single spatiotemporal cell, replacing any previous values.
+
+    A person is flagged as failed if either method hit the known solve failure (S > log2(N), -99),
+    matching the consistent-failure masking used in GeolifeEntropyCalc.run.
+
+    :param connection: Connection returned by open_store
+    :type connection: apsw.Connection
+    :param spatialRes: The spatial resolution of the cell
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cell
+    :type temporalRes: datetime.timedelta
+    :param person_ids: Person IDs, in the same order as the remaining arrays
+    :type person_ids: list of ints
+    """
+    Pi_DL = np.asarray(Pi_DL, dtype=np.float64)
+    Pi_RL = np.asarray(Pi_RL, dtype=np.float64)
+    failed = (Pi_DL < -1) | (Pi_RL < -1)
+
+    rows = zip( [int(spatialRes)]*len(person_ids), [int(temporalRes.total_seconds())]*len(person_ids),
+                [int(p) for p in person_ids], [float(s) for s in S], [int(n) for n in N_DL], [int(n) for n in N_RL],
+                Pi_DL.tolist(), Pi_RL.tolist(), failed.astype(int).tolist() )
+
+    curs = connection.cursor()
+    curs.execute('BEGIN')
+    curs.executemany('INSERT OR REPLACE INTO results VALUES(?,?,?,?,?,?,?,?,?)', rows)
+    curs.execute('END')
+
+def load_results(path, scheme = 'healpix'):
+    """
+    Loads the whole store into memory as a dictionary of column arrays.
+
+    :param path: Filename of the SQLite store
+    :type path: str
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py) the results are expected to be for
+    :type scheme: str
+    """
+    connection = open_store(path, scheme)
+    rows = connection.cursor().execute("SELECT spatialRes, temporalRes, person, S, N_DL, N_RL, Pi_DL, Pi_RL, failed FROM results").fetchall()
+    connection.close()
+
+    names = ['spatialRes','temporalRes','person','S','N_DL','N_RL','Pi_DL','Pi_RL','failed']
+    dtypes = [np.int64,np.int64,np.int64,np.float64,np.int64,np.int64,np.float64,np.float64,bool]
+    if len(rows) == 0:
+        return dict( (name, np.zeros(0, dtype=dtype)) for name, dtype in zip(names, dtypes) )
+
+    columns = zip(*rows)
+    return dict( (name, np.asarray(col, dtype=dtype)) for name, col, dtype in zip(names, columns, dtypes) )
+
+def _axis_index(values, axis):
+    """
+    Maps each value to its position in axis, -1 where it does not appear.
+    """
+    axis = np.asarray(axis)
+    order = np.argsort(axis)
+    pos = np.clip(np.searchsorted(axis[order], values), 0, len(axis)-1)
+    idx = order[pos]
+    idx[axis[idx] != values] = -1
+    return idx
+
+def select_cells(results, listSpatialRes, listTemporalRes, persons = "All"):
+    """
+    Restricts the loaded results to a group of people and to the cells of a heatmap grid.
+
+    Returns the row mask into results and the flat cell index (spatial major) of each selected row.
+
+    :param results: Column arrays as returned by load_results
+    :type results: dict
+    :param listSpatialRes: Spatial resolutions, one per heatmap row
+    :type listSpatialRes: list of ints denoting meters
+    :param listTemporalRes: Temporal resolutions, one per heatmap column
+    :type listTemporalRes: list of datetime.timedelta
+    :param persons: List of person IDs, or "All" for every person in the store
+    :type persons: list of ints or str
+    """
+    temporalSeconds = [int(t.total_seconds()) for t in listTemporalRes]
+
+    s_idx = _axis_index(results['spatialRes'], listSpatialRes)
+    t_idx = _axis_index(results['temporalRes'], temporalSeconds)
+    mask = (s_idx >= 0) & (t_idx >= 0)
+    if not persons == "All":
+        mask &= np.in1d(results['person'], np.asarray(persons, dtype=np.int64))
+
+    cell = s_idx[mask] * len(temporalSeconds) + t_idx[mask]
+
+    n_cells = len(listSpatialRes) * len(temporalSeconds)
+    n_persons = len(np.unique(results['person'][mask])) if persons == "All" else len(set(persons))
+    per_cell = np.bincount(cell, minlength=n_cells)
+    if (per_cell != n_persons).any():
+        missing = np.flatnonzero(per_cell != n_persons)
+        raise Exception("Error: The results store does not hold every requested person for {} cell(s) (flat cell indices {}). Run the sweep for these people first.".format(len(missing), missing.tolist()))
+
+    return mask, cell
+
+def group_heatmaps(results, listSpatialRes, listTemporalRes, persons = "All"):
+    """
+    Computes the heatmap matrices for any group of people from the stored per-person results.
+
+    People whose solve failed under either method in a cell are excluded from both averages
+    of that cell, as in GeolifeEntropyCalc.run.
+
+    Returns LoP_RL, LoP_DL, LoP_failed_ct (2D arrays, spatial x temporal) and the set of failed IDs.
+
+    :param results: Column arrays as returned by load_results
+    :type results: dict
+    :param listSpatialRes: Spatial resolutions, one per heatmap row
+    :type listSpatialRes: list of ints denoting meters
+    :param listTemporalRes: Temporal resolutions, one per heatmap column
+    :type listTemporalRes: list of datetime.timedelta
+    :param persons: List of person IDs, or "All" for every person in the store
+    :type persons: list of ints or str
+    """
+    mask, cell = select_cells(results, listSpatialRes, listTemporalRes, persons)
+    shape = (len(listSpatialRes), len(listTemporalRes))
+    n_cells = shape[0] * shape[1]
+
+    failed = results['failed'][mask]
+    ok = ~failed
+
+    if (results['Pi_RL'][mask][ok] < 0).any() or (results['Pi_DL'][mask][ok] < 0).any():
+        raise Exception("ERROR: The results store holds a negative upper bound that is not flagged as a known failure.")
+
+    ok_ct = np.bincount(cell[ok], minlength=n_cells).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        LoP_RL = np.bincount(cell[ok], weights=results['Pi_RL'][mask][ok], minlength=n_cells) / ok_ct
+        LoP_DL = np.bincount(cell[ok], weights=results['Pi_DL'][mask][ok], minlength=n_cells) / ok_ct
+    LoP_failed_ct = np.bincount(cell[failed], minlength=n_cells)
+
+    failed_ids = set(results['person'][mask][failed].tolist())
+
+    return LoP_RL.reshape(shape), LoP_DL.reshape(shape), LoP_failed_ct.reshape(shape), failed_ids
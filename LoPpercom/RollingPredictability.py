@@ -0,0 +1,225 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Predictability of each person over rolling time windows (e.g. per week or month).
+
+The windows of a person slide forward over their time ordered symbols, so N_DL and
+N_RL are maintained incrementally: symbols and (location, next location) pairs are
+added as the window end advances and removed as its start advances. The Lempel-Ziv
+match lengths depend on where the window starts, so the entropy rate is evaluated
+on each window. All windows of all people are solved in a single Matlab call.
+'''
+
+from __future__ import division
+from mlabwrap import mlab # @UnresolvedImport This is the import for mlabwrap
+import numpy as np
+from GeolifeSymbolisation import stream_geolife_data
+from GenericLoP import lzEntropyRate
+from Utils import ensure_dir
+
+class SuccessorCounter(object):
+    """
+    N_DL and N_RL of a sliding window of symbols.
+
+    Keeps the count of every location and of every (location, next location) pair in the
+    window, the number of distinct successors of every location and how many locations have
+    each number of successors, so that both values are updated in constant time.
+    """
+
+    def __init__(self):
+        self.location_ct = {}
+        self.pair_ct = {}
+        self.successor_ct = {}
+        self.successor_hist = {}
+        self.N_RL = 0
+
+    @property
+    def N_DL(self):
+        return len(self.location_ct)
+
+    def add_symbol(self, x):
+        self.location_ct[x] = self.location_ct.get(x, 0) + 1
+
+    def remove_symbol(self, x):
+        ct = self.location_ct[x] - 1
+        if ct == 0:
+            del self.location_ct[x]
+        else:
+            self.location_ct[x] = ct
+
+    def add_pair(self, x, y):
+        ct = self.pair_ct.get((x, y), 0)
+        self.pair_ct[(x, y)] = ct + 1
+        if ct == 0:
+            # new successor of x
+            succ = self.successor_ct.get(x, 0)
+            self._move(succ, succ + 1)
+            self.successor_ct[x] = succ + 1
+            if succ + 1 > self.N_RL:
+                self.N_RL = succ + 1
+
+    def remove_pair(self, x, y):
+        ct = self.pair_ct[(x, y)] - 1
+        if ct > 0:
+            self.pair_ct[(x, y)] = ct
+            return
+        del self.pair_ct[(x, y)]
+        succ = self.successor_ct[x]
+        self._move(succ, succ - 1)
+        if succ == 1:
+            del self.successor_ct[x]
+        else:
+            self.successor_ct[x] = succ - 1
+        # counts only change by one, so the maximum drops by at most one
+        if succ == self.N_RL and self.successor_hist.get(succ, 0) == 0:
+            self.N_RL = succ - 1
+
+    def _move(self, old, new):
+        if old > 0:
+            self.successor_hist[old] -= 1
+        if new > 0:
+            self.successor_hist[new] = self.successor_hist.get(new, 0) + 1
+
+def window_bounds(times, window, stride):
+    """
+    Returns the start time and the [first, last) symbol indices of every window.
+
+    Windows start at the first time and advance by stride until they start after the last time.
+
+    :param times: Time of every symbol, in increasing order
+    :type times: np.ndarray of datetime64
+    :param window: Length of a window
+    :type window: datetime.timedelta
+    :param stride: Offset between the starts of consecutive windows
+    :type stride: datetime.timedelta
+    """
+    if (np.diff(times) < np.timedelta64(0, 's')).any():
+        raise Exception("Error: The times of the symbols must be in increasing order.")
+    window = np.timedelta64(int(window.total_seconds()), 's')
+    stride = np.timedelta64(int(stride.total_seconds()), 's')
+    starts = np.arange(times[0], times[-1] + np.timedelta64(1, 's'), stride)
+    return starts, np.searchsorted(times, starts), np.searchsorted(times, starts + window)
+
+def rolling_entropies(sym_list, times, window, stride, min_points = 2):
+    """
+    Computes the entropy rate, N_DL and N_RL of every window of a single person.
+
+    Returns a list of (window start, number of symbols, S, N_DL, N_RL), skipping windows with fewer
+    than min_points symbols.
+
+    The caches concatenate a person's trajectories in trajectory order, which need not be time order
+    if trajectories overlap, so the symbols are first (stably) sorted by time.
+
+    :param sym_list: Location symbols
+    :type sym_list: np.ndarray of ints
+    :param times: Time of every symbol
+    :type times: np.ndarray of datetime64
+    :param window: Length of a window
+    :type window: datetime.timedelta
+    :param stride: Offset between the starts of consecutive windows
+    :type stride: datetime.timedelta
+    :param min_points: Minimum number of symbols in a window for it to be evaluated
+    :type min_points: int
+    """
+    order = np.argsort(times, kind='mergesort')
+    sym_list = np.asarray(sym_list).astype(np.int64)[order]
+    times = np.asarray(times)[order]
+    symbols = sym_list.tolist() # plain ints hash faster than numpy scalars
+    starts, first, last = window_bounds(times, window, stride)
+
+    counter = SuccessorCounter()
+    a, b = 0, 0 # the counter holds the window [a, b)
+    rtn = []
+    for start, a_new, b_new in zip(starts, first, last):
+        if a_new >= b:
+            # no overlap with the previous window, start again
+            counter = SuccessorCounter()
+            a, b = a_new, a_new
+        for i in range(b, b_new):
+            counter.add_symbol(symbols[i])
+            if i > a:
+                counter.add_pair(symbols[i-1], symbols[i])
+        b = max(b, b_new)
+        for i in range(a, a_new):
+            counter.remove_symbol(symbols[i])
+            if i + 1 < b:
+                counter.remove_pair(symbols[i], symbols[i+1])
+        a = a_new
+
+        if b - a >= min_points:
+            rtn.append((start, b - a, lzEntropyRate(sym_list[a:b]), counter.N_DL, counter.N_RL))
+
+    return rtn
+
+def rolling_predictability(spatialRes, temporalRes, window, stride, personsId = "All", min_points = 2, output_file = None, scheme = 'healpix'):
+    """
+    Computes a time series of the entropy rate, N and the upper bounds on predictability (original
+    and refined methods) for every person, over windows of the given length sliding by stride.
+
+    Returns a list of rows (person, window start, number of symbols, S, N_DL, N_RL, Pi_DL, Pi_RL),
+    optionally written to a CSV file. As in GeolifeEntropyCalc.run, a Pi of -99 marks a window whose
+    entropy estimate is too high for the solve (S > log2(N)).
+
+    :param spatialRes: The spatial resolution of the data
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the data
+    :type temporalRes: datetime.timedelta
+    :param window: Length of a window, e.g. timedelta(days=7)
+    :type window: datetime.timedelta
+    :param stride: Offset between the starts of consecutive windows
+    :type stride: datetime.timedelta
+    :param personsId: List of the person IDs, or "All"
+    :type personsId: List of ints
+    :param min_points: Minimum number of symbols in a window for it to be evaluated
+    :type min_points: int
+    :param output_file: CSV file the rows are written to, if given
+    :type output_file: str
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    rows = []
+    for person, sym_list, times in stream_geolife_data(spatialRes, temporalRes, personsId, scheme = scheme, withDates = True):
+        windows = rolling_entropies(sym_list, times, window, stride, min_points)
+        for start, n, S, N_DL, N_RL in windows:
+            rows.append([person, start, n, S, N_DL, N_RL])
+        print "Person {}: {} windows".format(person, len(windows))
+
+    if len(rows) == 0:
+        return rows
+
+    S = [r[3] for r in rows]
+    mlab.openPool()
+    Pi = list(mlab.ParLoP(S + S, [r[4] for r in rows] + [r[5] for r in rows])[0])
+    mlab.closePool()
+
+    if (np.asarray(Pi)==-88).any():
+        raise Exception("ERROR: Matlab failed the solve, but the entropy was in the correct range. Therefore an unknown error has occured.")
+
+    for row, Pi_DL, Pi_RL in zip(rows, Pi[:len(rows)], Pi[len(rows):]):
+        row.extend([Pi_DL, Pi_RL])
+
+    if output_file is not None:
+        ensure_dir(output_file)
+        f = open(output_file, 'w')
+        f.write('person,window_start,n,S,N_DL,N_RL,Pi_DL,Pi_RL\n')
+        for row in rows:
+            f.write('{},{},{},{:.5f},{},{},{:.5f},{:.5f}\n'.format(*row))
+        f.close()
+
+    return rows
@@ -0,0 +1,78 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Run-length codec for location symbol sequences, and N_DL / N_RL computed
+directly on the runs. Dataset agnostic, the storage of runs in the Geolife
+caches is in RunLengthEncoding.py.
+'''
+
+from __future__ import division
+import numpy as np
+
+def rle_encode(sym_list):
+    """
+    Encodes a symbol sequence as runs.
+
+    Returns (values, lengths), two int64 arrays with one entry per run.
+
+    :param sym_list: A list of location symbols
+    :type sym_list: list
+    """
+    sym_list = np.asarray(sym_list, dtype=np.int64)
+    if len(sym_list) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    starts = np.concatenate(([0], np.flatnonzero(sym_list[1:] != sym_list[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(sym_list)])))
+    return sym_list[starts], lengths.astype(np.int64)
+
+def rle_decode(values, lengths):
+    """
+    Expands runs back into the full symbol sequence.
+    """
+    return np.repeat(np.asarray(values, dtype=np.int64), np.asarray(lengths, dtype=np.int64))
+
+def get_N_DL_runs(values, lengths):
+    """
+    Computes the number of distinct locations of a run-length encoded trajectory.
+    Equal to GenericLoP.get_N_DL of the expanded trajectory.
+    """
+    return len(np.unique(values))
+
+def get_N_RL_runs(values, lengths):
+    """
+    Computes the maximum number of reachable locations of a run-length encoded trajectory.
+    Equal to GenericLoP.get_N_RL of the expanded trajectory.
+
+    Consecutive runs always hold different symbols, so the successors of a location are the
+    symbols of the runs that follow its runs, plus the location itself if any of its runs is
+    longer than one (however long the run, a self-transition only adds one successor).
+    """
+    values = np.asarray(values, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    selfs = values[lengths > 1]
+    src = np.concatenate((values[:-1], selfs))
+    dst = np.concatenate((values[1:], selfs))
+    if len(src) == 0:
+        return 0
+
+    pairs = np.unique(np.vstack((src, dst)).T.copy().view([('src', np.int64), ('dst', np.int64)]))
+    _, ct = np.unique(pairs['src'], return_counts=True)
+    return int(ct.max())
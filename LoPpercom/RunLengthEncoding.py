@@ -0,0 +1,99 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Run-length encoded storage of the cached trajectories.
+
+At fine temporal resolutions a person stays in the same location for long
+periods, so each person's symbol sequence is stored as (symbol, run length)
+pairs in a preproc_rle table, written along with the preproc table of a cache. The full
+sequence is only expanded (np.repeat) when the Lempel-Ziv estimator needs it;
+N_DL and N_RL are computed directly on the runs (see RunLengthCodec.py).
+'''
+
+from __future__ import division
+import apsw
+import numpy as np
+from GeolifeSymbolisation import cache_path, ensure_cache, _write_cache
+from CacheAccess import open_cache
+from RunLengthCodec import rle_encode, rle_decode, get_N_DL_runs, get_N_RL_runs # re-exported for existing callers
+
+def _from_blob(b):
+    return np.frombuffer(bytes(b), dtype=np.int64)
+
+def buildRunLengthTable(spatialRes, temporalRes, scheme = 'healpix'):
+    """
+    Adds the preproc_rle table to a cache written before it was built along with the cache.
+
+    As caches are read immutable (see CacheAccess.py), the cache is not modified in place: it is copied
+    into memory and written out again as a new file (see GeolifeSymbolisation._write_cache).
+
+    :param spatialRes: The spatial resolution of the cache.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution of the cache.
+    :type temporalRes: datetime.timedelta
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    print "Rewriting S: {} T: {} with run length encoding...".format(spatialRes, temporalRes)
+
+    path = cache_path(spatialRes, temporalRes, scheme)
+    writingConn = apsw.Connection(":memory:")
+    with writingConn.backup("main", open_cache(path), "main") as backup:
+        backup.step()
+    _write_cache(writingConn, path)
+    writingConn.close()
+
+def loadRunData(spatialRes, temporalRes, personsId = "All", scheme = 'healpix'):
+    """
+    Loads the run-length encoded trajectories for a given spatiotemporal resolution and set of person IDs.
+    Builds the cache if it does not exist, and rewrites caches from before the preproc_rle table was built with them.
+
+    Returns a list of (values, lengths) pairs, one per person, and the list of person IDs.
+
+    :param spatialRes: The spatial resolution required for the data.
+    :type spatialRes: int denoting meters
+    :param temporalRes: The temporal resolution required for the data.
+    :type temporalRes: datetime.timedelta
+    :param personsId: List of the person IDs for which the data should be fetched.
+    :type personsId: List of ints
+    :param scheme: The spatial quantisation scheme (see SpatialQuantisers.py)
+    :type scheme: str
+    """
+    ensure_cache(spatialRes, temporalRes, personsId, scheme)
+
+    curs = open_cache(cache_path(spatialRes, temporalRes, scheme)).cursor()
+    has_table = len(curs.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'preproc_rle'").fetchall()) > 0
+    if not has_table:
+        curs.close()
+        buildRunLengthTable(spatialRes, temporalRes, scheme)
+        curs = open_cache(cache_path(spatialRes, temporalRes, scheme)).cursor()
+
+    if personsId == "All":
+        personsId = [ x[0] for x in curs.execute("SELECT person FROM preproc_rle ORDER BY person") ]
+
+    runs = []
+    for person in personsId:
+        row = curs.execute("SELECT symbols, lengths FROM preproc_rle WHERE person = ?", (person,)).fetchall()
+        if len(row) == 0:
+            raise Exception("Error: The cache did not have the requested person ID. This is most likely because the bulk cache building method was used, which is hardcoded to only load the person IDs used in the PERCOM paper.")
+        runs.append( (_from_blob(row[0][0]), _from_blob(row[0][1])) )
+    curs.close()
+
+    print "Nb persons loaded : {}".format(len(runs))
+    return runs, personsId
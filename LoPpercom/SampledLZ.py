@@ -0,0 +1,127 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Sampled Lempel-Ziv entropy rate estimator for very long trajectories.
+
+The exact estimator (GenericLoP.lzEntropyRate) is S = n / sum_{i=1}^{n-1} L_i / log2(i+1),
+where L_i is the length of the shortest substring starting at position i that does
+not appear in the trajectory before i. Here the sum is estimated from L_i at a
+stratified random sample of positions, giving S with a confidence interval at a cost
+set by the sample budget rather than by the trajectory length.
+
+L_i is computed on the CPU with the usual definition (the earlier occurrence must end
+before i). Use GeolifeEntropyCalc.calibrate_sampled_entropy to check the estimates
+against the GPU library on real caches.
+'''
+
+from __future__ import division
+import numpy as np
+
+class MatchIndex(object):
+    """
+    The positions of every symbol of a trajectory, so the candidate earlier matches of a
+    position can be found without scanning the whole prefix.
+    """
+
+    def __init__(self, sym_list):
+        self.sym_list = np.asarray(sym_list, dtype=np.int64)
+        _, inverse = np.unique(self.sym_list, return_inverse=True)
+        self.order = np.argsort(inverse, kind='mergesort') # positions grouped by symbol, in increasing order
+        counts = np.bincount(inverse)
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+        self.inverse = inverse
+
+    def match_length(self, i):
+        """
+        Returns L_i, one more than the length of the longest substring starting at i that also
+        occurs entirely before i.
+        """
+        s = self.sym_list
+        n = len(s)
+        sym = self.inverse[i]
+        occurrences = self.order[self.starts[sym]:self.starts[sym+1]]
+        cand = occurrences[:np.searchsorted(occurrences, i)] # every earlier occurrence is a match of length 1
+        if len(cand) == 0:
+            return 1
+
+        k = 1
+        while i + k < n:
+            cand = cand[cand + k < i]
+            cand = cand[s[cand + k] == s[i + k]]
+            if len(cand) == 0:
+                break
+            k += 1
+        return k + 1
+
+def sampledEntropyRate(sym_list, sample_budget = 1000, z = 1.96, random_state = None):
+    """
+    Estimates the Lempel-Ziv entropy rate from a stratified random sample of positions.
+
+    Half of the budget evaluates the first positions exactly, as the 1/log2(i+1) weights make them
+    count the most and their matches are the cheapest to find. The remaining positions are split
+    into equal strata with two positions drawn from each, so the within-stratum variance, and hence
+    a confidence interval, can be estimated. Sequences with no more positions than the budget are
+    evaluated exactly (zero width interval).
+
+    Returns (S, S_low, S_high).
+
+    :param sym_list: A list of location symbols
+    :type sym_list: list
+    :param sample_budget: Number of positions at which L_i is evaluated
+    :type sample_budget: int
+    :param z: Standard normal quantile of the interval, 1.96 for 95%
+    :type z: float
+    :param random_state: Seed or numpy RandomState
+    :type random_state: int or np.random.RandomState
+    """
+    sym_list = np.asarray(sym_list, dtype=np.int64)
+    n = len(sym_list[sym_list >= 0])
+    if n < 2:
+        raise Exception("Error: At least two symbols are required to estimate the entropy rate, {} given.".format(n))
+
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    index = MatchIndex(sym_list)
+    def term(i):
+        return index.match_length(i) / np.log2(i + 1)
+
+    if n - 1 <= sample_budget:
+        T = sum(term(i) for i in range(1, n))
+        return n / T, n / T, n / T
+
+    head = sample_budget // 2
+    n_strata = max((sample_budget - head) // 2, 1)
+    bounds = np.linspace(head + 1, n, n_strata + 1).astype(np.int64)
+
+    T = sum(term(i) for i in range(1, head + 1))
+    var = 0.0
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        N_h = hi - lo
+        if N_h == 0:
+            continue
+        n_h = min(2, N_h)
+        y = np.asarray([term(i) for i in lo + random_state.choice(N_h, n_h, replace=False)])
+        T += N_h * y.mean()
+        if n_h > 1:
+            var += N_h**2 * (1 - n_h / N_h) * y.var(ddof=1) / n_h
+
+    se = np.sqrt(var)
+    S_high = n / (T - z * se) if T - z * se > 0 else np.inf
+    return n / T, n / (T + z * se), S_high
@@ -0,0 +1,193 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Shared memory data plane for parallel workers.
+
+A dataset is published once as a packed int64 symbol buffer with per-person
+offsets, in mmap-backed files (in /dev/shm where available, so they live in
+memory). Workers attach to it by name and write their results into a preallocated
+shared result array, so the only things pickled between processes are names and
+index ranges. (multiprocessing.shared_memory needs Python 3.8, memory mapped
+files give the same zero-copy sharing here.)
+'''
+
+from __future__ import division
+import numpy as np
+import os
+import tempfile
+from multiprocessing import Pool, cpu_count
+from GenericLoP import lzEntropyRate, get_N_DL, get_N_RL
+
+shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def _path(name, part):
+    return os.path.join(shared_dir, 'LoP_{}.{}'.format(name, part))
+
+def _remove(name, parts):
+    for part in parts:
+        if os.path.exists(_path(name, part)):
+            os.remove(_path(name, part))
+
+def _map(name, part):
+    path = _path(name, part)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.int64) # numpy cannot map an empty file
+    return np.memmap(path, dtype=np.int64, mode='r')
+
+class SharedDataset(object):
+    """
+    A list of trajectories packed into one memory mapped symbol buffer.
+    Trajectory i is symbols[offsets[i]:offsets[i+1]] and belongs to person_ids[i].
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.offsets = _map(name, 'offsets')
+        self.person_ids = _map(name, 'ids')
+        self.symbols = _map(name, 'symbols')
+
+    @classmethod
+    def publish(cls, name, person_stream):
+        """
+        Writes trajectories to the shared buffer one at a time and returns the attached dataset.
+
+        :param name: Name workers attach by
+        :type name: str
+        :param person_stream: Iterable of (person ID, list of location symbols), e.g. GeolifeSymbolisation.stream_geolife_data
+        :type person_stream: iterable of tuples
+        """
+        offsets = [0]
+        person_ids = []
+        f = open(_path(name, 'symbols'), 'wb')
+        try:
+            for person, sym_list in person_stream:
+                sym_list = np.ascontiguousarray(sym_list, dtype=np.int64)
+                f.write(sym_list.tostring())
+                offsets.append(offsets[-1] + len(sym_list))
+                person_ids.append(person)
+            f.close()
+            np.asarray(offsets, dtype=np.int64).tofile(_path(name, 'offsets'))
+            np.asarray(person_ids, dtype=np.int64).tofile(_path(name, 'ids'))
+        except:
+            # don't leave a partial dataset occupying memory in /dev/shm
+            f.close()
+            _remove(name, ['symbols', 'offsets', 'ids'])
+            raise
+        return cls(name)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.symbols[self.offsets[i]:self.offsets[i+1]]
+
+    def unlink(self):
+        del self.symbols, self.offsets, self.person_ids
+        _remove(self.name, ['symbols', 'offsets', 'ids'])
+
+class SharedResults(object):
+    """
+    A preallocated (rows x columns) float64 array that workers write into by row.
+    """
+
+    def __init__(self, name, mode = 'r+', shape = None):
+        self.name = name
+        if shape is None:
+            shape = tuple(np.fromfile(_path(name, 'shape'), dtype=np.int64))
+        self.values = np.memmap(_path(name, 'results'), dtype=np.float64, mode=mode, shape=shape)
+
+    @classmethod
+    def create(cls, name, n_rows, n_cols):
+        np.asarray([n_rows, n_cols], dtype=np.int64).tofile(_path(name, 'shape'))
+        results = cls(name, mode='w+', shape=(n_rows, n_cols))
+        results.values[:] = np.nan
+        return results
+
+    @classmethod
+    def attach(cls, name):
+        return cls(name)
+
+    def unlink(self):
+        del self.values
+        _remove(self.name, ['results', 'shape'])
+
+def _entropy_worker(task):
+    dataset_name, results_name, first, last = task
+    dataset = SharedDataset.attach(dataset_name)
+    results = SharedResults.attach(results_name)
+    for i in range(first, last):
+        sym_list = np.asarray(dataset[i])
+        if len(sym_list) == 0:
+            raise Exception("One or more person's trajectory was not loaded/created correctly.")
+        results.values[i] = [lzEntropyRate(sym_list), get_N_DL(sym_list), get_N_RL(sym_list)]
+    results.values.flush()
+    return last - first
+
+def parallelEntropyRates(person_stream, name = None, processes = None):
+    """
+    Computes the entropy rate, N_DL and N_RL of every person in parallel over the shared data plane.
+
+    The trajectories are published once, each worker attaches by name to evaluate a range of people and
+    writes its results into the shared result array. Returns (person IDs, S, N_DL, N_RL) with the same
+    values as GenericLoP.streamEntropyRates.
+
+    :param person_stream: Iterable of (person ID, list of location symbols), e.g. GeolifeSymbolisation.stream_geolife_data
+    :type person_stream: iterable of tuples
+    :param name: Name of the shared buffers, must be unique among concurrent runs. Defaults to one based on the process ID.
+    :type name: str
+    :param processes: Number of worker processes, defaults to the number of CPUs less 2
+    :type processes: int
+    """
+    if name is None:
+        name = 'pid{}'.format(os.getpid())
+    if processes is None:
+        processes = max(cpu_count() - 2, 1) # leave some CPU for day to day tasks, as in bulk_build_resolution_cache
+
+    dataset = SharedDataset.publish(name, person_stream)
+    if len(dataset) == 0:
+        dataset.unlink()
+        return [], [], [], []
+    
+    results = SharedResults.create(name, len(dataset), 3)
+    try:
+        # Balance the chunks by number of symbols, not people
+        bounds = np.searchsorted(np.asarray(dataset.offsets[1:]), np.linspace(0, dataset.offsets[-1], processes * 4 + 1)[1:-1])
+        bounds = np.unique(np.concatenate(([0], bounds, [len(dataset)])))
+        tasks = [(name, name, int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+
+        pool = Pool( processes = processes )
+        try:
+            pool.map(_entropy_worker, tasks)
+            pool.close()
+        finally:
+            # stops the remaining workers if one raised, otherwise they have already finished
+            pool.terminate()
+            pool.join()
+
+        values = np.array(results.values)
+        person_ids = np.array(dataset.person_ids).tolist()
+    finally:
+        dataset.unlink()
+        results.unlink()
+
+    return person_ids, values[:,0].tolist(), values[:,1].astype(np.int64).tolist(), values[:,2].astype(np.int64).tolist()
@@ -0,0 +1,145 @@
+'''
+Created on 19 Oct 2026
+
+@author: agent
+
+@copyright: This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Lesser General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Lesser General Public License for more details.
+
+    You should have received a copy of the GNU Lesser General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Spatial quantisers mapping (longitude, latitude) to integer location symbols.
+
+Every quantiser is constructed from a spatial resolution given in the same units
+as listSpatialRes (the area of a cell in square meters), exposes a vectorised
+quantise(longitude, latitude) method and describes itself for the infoSample
+table of a preprocessing cache.
+
+* HealpixQuantiser: The HEALPix sphere pixelisation used for the PERCOM paper.
+* ProjectedGridQuantiser: A square grid on a Lambert azimuthal equal-area projection
+  centred on the study area. Much cheaper than HEALPix and, since the projection is
+  equal-area, every cell covers exactly spatialRes square meters. Only valid for
+  city/region scale data (Geolife is mostly Beijing) as shapes distort far from the centre.
+'''
+
+from __future__ import division
+import numpy as np
+import healpy as hp  # @UnresolvedImport
+
+EARTH_SURFACE_AREA = 510072000000000 # m^2
+EARTH_AUTHALIC_RADIUS = 6371007.2 # m, radius of the sphere with the above surface area
+
+def ComputeNside(spatialRes):
+    """
+    Computes the HEALPix Nside whose pixel area is nearest to the spatial resolution.
+
+    :param spatialRes: The spatial resolution required
+    :type spatialRes: int denoting square meters
+    """
+    # HEALPix has 12 * 4**order pixels at Nside = 2**order. Consider every order up to
+    # (and including) the first whose pixels are smaller than the requested resolution.
+    orders = np.arange(30)
+    listNpix = 12 * 4**orders
+    listRes = EARTH_SURFACE_AREA // listNpix
+    last = np.flatnonzero(listRes < spatialRes)
+    last = last[0] if len(last) > 0 else len(orders) - 1
+    listRes = listRes[:last+1]
+
+    #find the nearest value :
+    idx = (np.abs(listRes-spatialRes)).argmin()
+    nearestSpatialRes = listRes[idx]
+    npix = listNpix[idx]
+    nside = 2**int(idx)
+    print "nearestSpatialRes = {}, Npix = {} and Nside = {}".format(nearestSpatialRes, npix, nside)
+    return nside
+
+
+class HealpixQuantiser(object):
+    """
+    HEALPix pixelisation at the Nside nearest to the requested resolution.
+    """
+    scheme = 'healpix'
+
+    def __init__(self, spatialRes, nest = True):
+        self.spatialRes = spatialRes
+        self.nest = nest
+        self.nside = ComputeNside(spatialRes)
+
+    def quantise(self, longitude, latitude):
+        longitude = np.asarray(longitude, dtype=np.float64)
+        latitude = np.asarray(latitude, dtype=np.float64)
+        return np.asarray(hp.ang2pix(self.nside, (90 - latitude) * np.pi / 180, longitude * np.pi / 180, self.nest), dtype=np.int64)
+
+    def info(self):
+        return {'nside' : self.nside, 'scheme' : self.scheme, 'params' : 'nest={}'.format(int(self.nest))}
+
+
+class ProjectedGridQuantiser(object):
+    """
+    Square cells of spatialRes square meters on a Lambert azimuthal equal-area
+    projection about (lat0, lon0). Defaults to the centre of Beijing.
+    """
+    scheme = 'grid'
+
+    # Cell indices are offset to be non-negative and packed into a single int64 symbol.
+    OFFSET = 2**30
+    WIDTH = 2**31
+
+    def __init__(self, spatialRes, lat0 = 39.9042, lon0 = 116.4074):
+        self.spatialRes = spatialRes
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.cell_side = np.sqrt(spatialRes)
+        self._sin_phi0 = np.sin(np.radians(lat0))
+        self._cos_phi0 = np.cos(np.radians(lat0))
+
+    def project(self, longitude, latitude):
+        """
+        Returns the projected (x, y) coordinates in meters.
+        """
+        phi = np.radians(np.asarray(latitude, dtype=np.float64))
+        dlam = np.radians(np.asarray(longitude, dtype=np.float64) - self.lon0)
+        sin_phi = np.sin(phi)
+        cos_phi = np.cos(phi)
+        cos_dlam = np.cos(dlam)
+        k = np.sqrt(2 / (1 + self._sin_phi0 * sin_phi + self._cos_phi0 * cos_phi * cos_dlam))
+        x = EARTH_AUTHALIC_RADIUS * k * cos_phi * np.sin(dlam)
+        y = EARTH_AUTHALIC_RADIUS * k * (self._cos_phi0 * sin_phi - self._sin_phi0 * cos_phi * cos_dlam)
+        return x, y
+
+    def quantise(self, longitude, latitude):
+        x, y = self.project(longitude, latitude)
+        ix = np.floor(x / self.cell_side).astype(np.int64) + self.OFFSET
+        iy = np.floor(y / self.cell_side).astype(np.int64) + self.OFFSET
+        return iy * self.WIDTH + ix
+
+    def info(self):
+        return {'nside' : None, 'scheme' : self.scheme,
+                'params' : 'lat0={},lon0={},cell_side={}'.format(self.lat0, self.lon0, self.cell_side)}
+
+
+QUANTISERS = {HealpixQuantiser.scheme : HealpixQuantiser,
+              ProjectedGridQuantiser.scheme : ProjectedGridQuantiser}
+
+def make_quantiser(scheme, spatialRes, **kwargs):
+    """
+    Constructs the quantiser registered under a scheme name.
+
+    :param scheme: One of the keys of QUANTISERS, e.g. 'healpix' or 'grid'
+    :type scheme: str
+    :param spatialRes: The spatial resolution required
+    :type spatialRes: int denoting square meters
+    """
+    try:
+        return QUANTISERS[scheme](spatialRes, **kwargs)
+    except KeyError:
+        raise Exception( "Error: Unknown spatial quantisation scheme. Only {} known, {} given.".format(sorted(QUANTISERS.keys()), scheme) )